@@ -66,8 +66,9 @@ def Charging_Process(Profiles_user, User_list, country, year, dummy_days, residu
     
     # Initialization of output variables
     Charging_profile_user = {}
-    Charging_profile = np.zeros(len(Profiles_user['Working - Large car']))
-    en_sys_tot = np.zeros(len(Profiles_user['Working - Large car']))
+    n_periods = utils.profile_minutes(Profiles_user['Working - Large car']) # Minute profiles or trip events
+    Charging_profile = np.zeros(n_periods)
+    en_sys_tot = np.zeros(n_periods)
     SOC_user = {}
     plug_in_user = {}
     num_us = 0
@@ -75,7 +76,6 @@ def Charging_Process(Profiles_user, User_list, country, year, dummy_days, residu
 
     # Creation of date array 
     start_day = dt.datetime(year, 1, 1) - dt.timedelta(days=dummy_days)
-    n_periods = len(Profiles_user['Working - Large car'])
     minutes = pd.date_range(start=start_day, periods = n_periods, freq='T')
 
     # Check if introducing the logistic function for behavioural modeling
@@ -123,25 +123,26 @@ def Charging_Process(Profiles_user, User_list, country, year, dummy_days, residu
         SOC_user[Us.user_name] = []
         plug_in_user[Us.user_name] = []
         
-        plug_in_Us = np.zeros((len(Profiles_user[Us.user_name]), Us.num_users), dtype = int) # Initialise plug-in array
-
-        # Brings tha values put to 0.001 for the mask to 0
-        Profiles_user[Us.user_name] = np.where(Profiles_user[Us.user_name] < 0.1, 0, Profiles_user[Us.user_name]) 
-        # Sets to power consumed by the car to negative values
-        power_Us = np.where(Profiles_user[Us.user_name] > 0, -Profiles_user[Us.user_name], 0) 
-        power_Us = power_Us / 1000 #kW
-        
-        # Users who never take the car in the considered period are skipped
-        power_Us = power_Us[:,np.where(power_Us.any(axis=0))[0]] 
+        if isinstance(Profiles_user[Us.user_name], pd.DataFrame): # Trip events, expanded to minutes one user at a time
+            power_Us = utils.events_power(Profiles_user[Us.user_name], n_periods)
+        else:
+            # Brings tha values put to 0.001 for the mask to 0
+            Profiles_user[Us.user_name] = np.where(Profiles_user[Us.user_name] < 0.1, 0, Profiles_user[Us.user_name]) 
+            # Sets to power consumed by the car to negative values
+            power_Us = np.where(Profiles_user[Us.user_name] > 0, -Profiles_user[Us.user_name], 0) 
+            power_Us = power_Us / 1000 #kW
+            
+            # Users who never take the car in the considered period are skipped
+            power_Us = power_Us[:,np.where(power_Us.any(axis=0))[0]].T
         
         Battery_cap_Us_min = Us.App_list[0].Battery_cap * 60 # Capacity multiplied by 60 to evaluate the capacity in kWmin
         Battery_cap_Us_h = Us.App_list[0].Battery_cap # Capacity multiplied by 60 to evaluate the capacity in kWmin
         
-        for i in range(power_Us.shape[1]): # Simulates for each single user with at least one travel
+        for i, power in enumerate(power_Us): # Simulates for each single user with at least one travel
             
             # Filter power for the specific user            
-            plug_in = plug_in_Us[:,i]
-            power = power_Us[:, i] 
+            plug_in = np.zeros(n_periods, dtype = int) # Initialise plug-in array
+            power = power.astype(np.float64) # The SOC is always calculated in double precision
             
             # Variation of SOC for each minute, 
             delta_soc = power / Battery_cap_Us_min 
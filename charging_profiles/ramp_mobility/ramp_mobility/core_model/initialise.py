@@ -110,13 +110,20 @@ def Initialise_model(dummy_days, full_year, year):
 
     return (Profile, Usage, Profile_user, Usage_user, num_profiles_user, num_profiles_sim)
     
-def Initialise_inputs(inputfile, country, year, full_year):
+def Initialise_inputs(inputfile, country, year, full_year, dtype = 'float64', events = False):
     
     Year_behaviour, dummy_days = yearly_pattern(country, year)
     User_list = user_defined_inputs(inputfile)
     (Profile, Usage, Profile_user, Usage_user, num_profiles_user,num_profiles_sim
      ) = Initialise_model(dummy_days, full_year, year)
     
+    # The user-detailed profiles of each User class are preallocated as an array of users x simulated minutes, 
+    # unless they are returned as trip events
+    if events:
+        Profile_user = {}
+    else:
+        Profile_user = {Us.user_name: np.zeros((Us.num_users, num_profiles_sim*1440), dtype = dtype) for Us in User_list}
+    
     if calendar.isleap(year) and num_profiles_user == 365:
         print('[WARNING] A leap year is being simulated with 365 days, if you want to simulate the whole year please insert 366 as profiles number') 
 
@@ -2,20 +2,75 @@
 
 #%% Import required libraries
 import numpy as np
-import numpy.ma as ma
+import bisect
 import random 
 import math
 import pandas as pd
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 from ramp_mobility.core_model.initialise import Initialise_model, Initialise_inputs 
+from ramp_mobility.utils import event_minutes
+
+#%% Free spots of the functioning windows
+
+class Free_spots():
+    '''
+    Free spots [start, stop) of the functioning windows of an Appliance in a day, where the app is not yet on.
+    The spots are kept sorted by start time and their lengths are kept sorted, so that finding the spot of a minute,
+    occupying part of a spot and querying the largest spot are binary searches instead of scans of the daily profile
+    '''
+    def __init__(self, windows):
+        self.starts = [] #sorted start times of the free spots
+        self.stops = [] #stop times of the free spots, in the same order
+        for start, stop in sorted((int(w[0]), int(w[1])) for w in windows if w[1] > w[0]): #overlapping windows are merged
+            if self.stops and start <= self.stops[-1]:
+                self.stops[-1] = max(self.stops[-1], stop)
+            else:
+                self.starts.append(start)
+                self.stops.append(stop)
+        self.lengths = sorted(stop - start for start, stop in zip(self.starts, self.stops))
+    
+    def find(self, minute):
+        '''
+        Returns the index of the free spot containing the minute, None if the app is already on or out of the windows
+        '''
+        spot = bisect.bisect_right(self.starts, minute) - 1
+        if spot >= 0 and minute < self.stops[spot]:
+            return spot
+        return None
+    
+    def occupy(self, start, stop):
+        '''
+        Removes the minutes [start, stop) from the free spot containing start
+        '''
+        if stop <= start:
+            return
+        spot = self.find(start)
+        spot_start, spot_stop = self.starts[spot], self.stops[spot]
+        del self.lengths[bisect.bisect_left(self.lengths, spot_stop - spot_start)]
+        del self.starts[spot], self.stops[spot]
+        for piece_start, piece_stop in [(stop, spot_stop), (spot_start, start)]: #the parts of the spot left free before and after the switch-on event
+            if piece_stop > piece_start:
+                self.starts.insert(spot, piece_start)
+                self.stops.insert(spot, piece_stop)
+                bisect.insort(self.lengths, piece_stop - piece_start)
+    
+    def max_free(self):
+        '''
+        Returns the length of the largest free spot
+        '''
+        return self.lengths[-1] if self.lengths else 0
 
 #%% Core model stochastic script
 
-def Stochastic_Process_Mobility(inputfile, country, year, full_year):
+def Stochastic_Process_Mobility(inputfile, country, year, full_year, engine = 'batch', seed = None, workers = 1, dtype = 'float64', events = False):
+    
+    assert engine in ['batch', 'loop'], f"[CRITICAL] Invalid engine '{engine}'. Expected either 'batch' or 'loop'"
+    assert engine == 'batch' or not events, "[CRITICAL] Trip events are only returned by the 'batch' engine"
     
     (peak_enlarg, mu_peak, s_peak, Year_behaviour, User_list, 
      Profile, Usage, Profile_user, Usage_user, num_profiles_user, 
-     num_profiles_sim, dummy_days) = Initialise_inputs(inputfile, country, year, full_year)
+     num_profiles_sim, dummy_days) = Initialise_inputs(inputfile, country, year, full_year, dtype, events)
     
     '''
     Calculation of the peak time range, which is used to discriminate between off-peak and on-peak coincident switch-on probability
@@ -23,22 +78,36 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
     The peak window is just a time window in which coincident switch-on of multiple appliances assumes a higher probability than off-peak
     Within the peak window, a random peak time is calculated and then enlarged into a peak_time_range following again a random procedure
     '''
-    windows_curve = np.zeros(1440) #creates an empty daily profile
-    Tot_curve = np.zeros(1440) #creates another empty daily profile
-          
-    for Us in User_list:
-        App_count = 0
-        for App in Us.App_list:
-            #Calculate windows curve, i.e. the theoretical maximum curve that can be obtained, for each app, by switching-on always all the 'n' apps altogether in any time-step of the functioning windows
-            single_wcurve = Us.App_list[App_count].daily_use*np.mean(Us.App_list[App_count].POWER)*Us.App_list[App_count].number #this computes the curve for the specific App
-            windows_curve = np.vstack([windows_curve, single_wcurve]) #this stacks the specific App curve in an overall curve comprising all the Apps within a User class
-            App_count += 1
-        Us.windows_curve = windows_curve #after having iterated for all the Apps within a User class, saves the overall User class theoretical maximum curve
-        Us.windows_curve = np.transpose(np.sum(Us.windows_curve, axis = 0))*Us.num_users
-        Tot_curve = Tot_curve + Us.windows_curve #adds the User's theoretical max profile to the total theoretical max comprising all classes
-    peak_window = np.transpose(np.argwhere(Tot_curve == np.amax(Tot_curve))) #Find the peak window within the theoretical max profile
-    peak_time = round(random.normalvariate(round(np.average(peak_window)),1/3*(peak_window[0,-1]-peak_window[0,0]))) #Within the peak_window, randomly calculate the peak_time using a gaussian distribution
-    peak_time_range = np.arange((peak_time-round(math.fabs(peak_time-(random.gauss(peak_time,(peak_enlarg*peak_time)))))),(peak_time+round(math.fabs(peak_time-random.gauss(peak_time,(peak_enlarg*peak_time)))))) #the peak_time is randomly enlarged based on the calibration parameter peak_enlarg
+    if engine == 'batch': #all the users of a User class are simulated at once, with a numpy random generator
+        seeds = np.random.SeedSequence(seed).spawn(num_profiles_sim + 1) #an independent random stream for each day, so that the profiles do not depend on the number of workers
+        peak_rng = np.random.default_rng(seeds[0])
+        peak_time_range = Peak_time_range(User_list, peak_enlarg, peak_rng.normal, peak_rng.normal)
+        weeks = [range(d, min(d + 7, num_profiles_sim)) for d in range(0, num_profiles_sim, 7)] #weeks of days are simulated by the workers and merged back in order
+        args = ([User_list]*len(weeks), [Year_behaviour[w.start:w.stop] for w in weeks], [peak_time_range]*len(weeks),
+                [mu_peak]*len(weeks), [s_peak]*len(weeks), [seeds[w.start + 1:w.stop + 1] for w in weeks])
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            if workers > 1 or events: #the workers return the user profiles of their week, which are copied in place, or their trip events
+                results = (pool.map if workers > 1 else map)(Days_batch, *args, [None]*len(weeks), [dtype]*len(weeks), [events]*len(weeks))
+            else: #the user profiles are written in place
+                results = map(Days_batch, *args, [{name: profiles[:, w.start*1440:w.stop*1440] for name, profiles in Profile_user.items()} for w in weeks])
+            for w, (week, week_profiles) in zip(weeks, results):
+                if events:
+                    for name, (users, days, start, duration, power) in week_profiles.items():
+                        Profile_user.setdefault(name, []).append((users, days + w.start, start, duration, power))
+                elif workers > 1:
+                    for name, profiles in week_profiles.items():
+                        Profile_user[name][:, w.start*1440:w.stop*1440] = profiles
+                for prof_i, (Tot_Classes, Tot_Usage) in zip(w, week):
+                    if (dummy_days - 1) < prof_i < (num_profiles_sim - dummy_days): # Do not append dummy days
+                        Profile.append(Tot_Classes)
+                        Usage.append(Tot_Usage)
+                        print(f'Profile {prof_i - dummy_days +1}/{num_profiles_user} completed')
+        if events:
+            Profile_user = {name: Events_table([np.concatenate(column) for column in zip(*class_weeks)], num_profiles_sim*1440) for name, class_weeks in Profile_user.items()}
+        return(Profile, Usage, User_list, Profile_user, dummy_days)
+    
+    random.seed(seed)
+    peak_time_range = Peak_time_range(User_list, peak_enlarg)
     
     '''
     The core stochastic process starts here. For each profile requested by the software user, 
@@ -47,16 +116,12 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
     for prof_i in range(num_profiles_sim): #the whole code is repeated for each profile that needs to be generated
         Tot_Classes = np.zeros(1440) #initialise an empty daily profile that will be filled with the sum of the hourly profiles of each User instance
         Tot_Usage = np.zeros(1440) #initialise an empty daily usage profile that will be filled with the sum of the hourly usage of each User instance
-        Profile_dict = {}
-        Usage_dict = {}
         for Us in User_list: #iterates for each User instance (i.e. for each user class)
             Us.load = np.zeros(1440) #initialise empty load for User instance
             Us.usage = np.zeros(1440) #initialise empty usage profile for User instance
             # Profile_dict[Us.user_name] = np.zeros((1440 * (prof_i + 1),Us.num_users)) #initialise empty user-detailed usage profile for User instance
             # Profile_dict[Us.user_name] = np.zeros((1440,Us.num_users)) #initialise empty user-detailed usage profile for User instance
             # daily_use_tot = np.zeros((1440,Us.num_users))
-            Profile_dict[Us.user_name] = []
-            Usage_dict[Us.user_name] = []
             for i in range(Us.num_users): #iterates for every single user within a User class. Each single user has its own separate randomisation
                 daily_profile_tot = np.zeros(1440)
                 daily_usage_tot = np.zeros(1440)
@@ -132,7 +197,7 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                         App.daily_use[rand_window_1[0]:rand_window_1[1]] = np.full(np.diff(rand_window_1),0.001)
                         App.daily_use[rand_window_2[0]:rand_window_2[1]] = np.full(np.diff(rand_window_2),0.001)
                         App.daily_use[rand_window_3[0]:rand_window_3[1]] = np.full(np.diff(rand_window_3),0.001)
-                    App.daily_use_masked = np.zeros_like(ma.masked_not_equal(App.daily_use,0.001))
+                    free_spots = Free_spots([rand_window_1, rand_window_2, rand_window_3]) #sorted free spots of the newly defined windows, where the app is not yet on
                                   
                     #random variability is applied to the total functioning time and to the duration of the duty cycles, if they have been specified
                     if App.activate == 1:
@@ -176,10 +241,11 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                             else: 
                                 switch_on = int(random.choice([random.uniform(rand_window_1[0],(rand_window_1[1])),random.uniform(rand_window_2[0],(rand_window_2[1])),random.uniform(rand_window_3[0],(rand_window_3[1]))]))
                             #Identifies a random switch on time within the available functioning windows
-                            if App.daily_use[switch_on] == 0.001: #control to check if the app is not already on at the randomly selected switch-on time
+                            spot = free_spots.find(switch_on)
+                            if spot is not None: #control to check if the app is not already on at the randomly selected switch-on time
                                 if switch_on in range(rand_window_1[0],rand_window_1[1]):
-                                    if np.any(App.daily_use[switch_on:rand_window_1[1]]!=0.001): #control to check if there are any other switch on times after the current one    
-                                        next_switch = [switch_on + k[0] for k in np.where(App.daily_use[switch_on:]!=0.001)] #identifies the position of next switch on time and sets it as a limit for the duration of the current switch on
+                                    if free_spots.stops[spot] < rand_window_1[1]: #control to check if there are any other switch on times after the current one    
+                                        next_switch = [free_spots.stops[spot]] #the end of the free spot is the position of next switch on time and sets it as a limit for the duration of the current switch on
                                         if (next_switch[0] - switch_on) >= App.func_cycle and max_free_spot >= App.func_cycle:
                                             upper_limit = min((next_switch[0]-switch_on),min(rand_time,rand_window_1[1]-switch_on))
                                         elif (next_switch[0] - switch_on) < App.func_cycle and max_free_spot >= App.func_cycle: #if next switch_on event does not allow for a minimum functioning cycle without overlapping, but there are other larger free spots, the cycle tries again from the beginning
@@ -195,8 +261,8 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                                         indexes = np.arange(switch_on,switch_on+upper_limit) #this is the case in which empty spaces need to be filled without constraints to reach the total time goal
                                         
                                 elif switch_on in range(rand_window_2[0],rand_window_2[1]): #if random switch_on happens in windows2, same code as above is repeated for windows2
-                                    if np.any(App.daily_use[switch_on:rand_window_2[1]]!=0.001):
-                                        next_switch = [switch_on + k[0] for k in np.where(App.daily_use[switch_on:]!=0.001)]
+                                    if free_spots.stops[spot] < rand_window_2[1]:
+                                        next_switch = [free_spots.stops[spot]]
                                         if (next_switch[0] - switch_on) >= App.func_cycle and max_free_spot >= App.func_cycle:
                                             upper_limit = min((next_switch[0]-switch_on),min(rand_time,rand_window_2[1]-switch_on))
                                         elif (next_switch[0] - switch_on) < App.func_cycle and max_free_spot >= App.func_cycle:
@@ -213,8 +279,8 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                                         indexes = np.arange(switch_on,switch_on+upper_limit)
                                         
                                 else: #if switch_on is not in window1 nor in window2, it shall be in window3. Same code is repreated
-                                    if np.any(App.daily_use[switch_on:rand_window_3[1]]!=0.001):
-                                        next_switch = [switch_on + k[0] for k in np.where(App.daily_use[switch_on:]!=0.001)]
+                                    if free_spots.stops[spot] < rand_window_3[1]:
+                                        next_switch = [free_spots.stops[spot]]
                                         if (next_switch[0] - switch_on) >= App.func_cycle and max_free_spot >= App.func_cycle:
                                             upper_limit = min((next_switch[0]-switch_on),min(rand_time,rand_window_3[1]-switch_on))
                                         elif (next_switch[0] - switch_on) < App.func_cycle and max_free_spot >= App.func_cycle:
@@ -254,17 +320,13 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                                         #based on the evaluate value, selects the proper duty cycle and puts the corresponding power values in the indexes range
                                         if evaluate in range(App.cw11[0],App.cw11[1]) or evaluate in range(App.cw12[0],App.cw12[1]):
                                             np.put(App.daily_use,indexes_adj,(random_cycle1*coincidence))
-                                            np.put(App.daily_use_masked,indexes_adj,(random_cycle1*coincidence),mode='clip')
                                         elif evaluate in range(App.cw21[0],App.cw21[1]) or evaluate in range(App.cw22[0],App.cw22[1]):
                                             np.put(App.daily_use,indexes_adj,(random_cycle2*coincidence))
-                                            np.put(App.daily_use_masked,indexes_adj,(random_cycle2*coincidence),mode='clip')
                                         else:
                                             np.put(App.daily_use,indexes_adj,(random_cycle3*coincidence))
-                                            np.put(App.daily_use_masked,indexes_adj,(random_cycle3*coincidence),mode='clip')
                                     else: #if no duty cycles are specififed, a regular switch_on event is modelled
                                         np.put(App.daily_use,indexes_adj,(App.power*(random.uniform((1-App.P_var),(1+App.P_var)))*coincidence)) #randomises also the App Power if P_var is on
-                                        np.put(App.daily_use_masked,indexes_adj,(App.power*(random.uniform((1-App.P_var),(1+App.P_var)))*coincidence),mode='clip')
-                                    App.daily_use_masked = np.zeros_like(ma.masked_greater_equal(App.daily_use_masked,0.001)) #updates the mask excluding the current switch_on event to identify the free_spots for the next iteration
+                                    free_spots.occupy(switch_on, switch_on + indexes_adj.size) #removes the current switch_on event from the free_spots for the next iteration
                                     tot_time = (tot_time - indexes.size) + indexes_adj.size #updates the total time correcting the previous value
                                     break #exit cycle and go to next App
                                 else: #if the tot_time has not yet exceeded the App total functioning time, the cycle does the same without applying corrections to indexes size
@@ -287,26 +349,16 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                                             evaluate = 0
                                         if evaluate in range(App.cw11[0],App.cw11[1]) or evaluate in range(App.cw12[0],App.cw12[1]):
                                             np.put(App.daily_use,indexes,(random_cycle1*coincidence))
-                                            np.put(App.daily_use_masked,indexes,(random_cycle1*coincidence),mode='clip')
                                         elif evaluate in range(App.cw21[0],App.cw21[1]) or evaluate in range(App.cw22[0],App.cw22[1]):
                                             np.put(App.daily_use,indexes,(random_cycle2*coincidence))
-                                            np.put(App.daily_use_masked,indexes,(random_cycle2*coincidence),mode='clip')
                                         else:
                                             np.put(App.daily_use,indexes,(random_cycle3*coincidence))
-                                            np.put(App.daily_use_masked,indexes,(random_cycle3*coincidence),mode='clip')
                                     else:
                                         np.put(App.daily_use,indexes,(App.power*(random.uniform((1-App.P_var),(1+App.P_var)))*coincidence))
-                                        np.put(App.daily_use_masked,indexes,(App.power*(random.uniform((1-App.P_var),(1+App.P_var)))*coincidence),mode='clip')
-                                    App.daily_use_masked = np.zeros_like(ma.masked_greater_equal(App.daily_use_masked,0.001))
+                                    free_spots.occupy(switch_on, switch_on + indexes.size)
                                     tot_time = tot_time #no correction applied to previously calculated value
                                                     
-                                free_spots = [] #calculate how many free spots remain for further switch_ons
-                                try:
-                                    for j in ma.notmasked_contiguous(App.daily_use_masked):
-                                        free_spots.append(j.stop-j.start)
-                                except TypeError:
-                                    free_spots = [0]
-                                max_free_spot = max(free_spots) 
+                                max_free_spot = free_spots.max_free() #largest free spot that remains for further switch_ons
     
                             else:
                                 continue #if the random switch_on falls somewhere where the App has been already turned on, tries again from beginning of the while cycle
@@ -316,16 +368,287 @@ def Stochastic_Process_Mobility(inputfile, country, year, full_year):
                     Us.usage = Us.usage + App.usage #adds the App usage to the User usage profile
                     daily_profile_tot = daily_profile_tot + App.daily_use
 #                    daily_usage_tot = daily_usage_tot + App.usage
-                Profile_dict[Us.user_name].append(daily_profile_tot)
-#                Usage_dict[Us.user_name].append(daily_usage_tot)
+                Profile_user[Us.user_name][i, prof_i*1440:(prof_i+1)*1440] = daily_profile_tot #writes the user profile in the preallocated array of the class
             Tot_Classes = Tot_Classes + Us.load #adds the User load to the total load of all User classes
             Tot_Usage = Tot_Usage + Us.usage
-        Profile_user.append(Profile_dict)
         if (dummy_days - 1) < prof_i < (num_profiles_sim - dummy_days): # Do not append dummy days
             Profile.append(Tot_Classes) #appends the total load to the list that will contain all the generated profiles
             Usage.append(Tot_Usage)#appends the total usage to the list that will contain all the generated profiles
-#            Usage_user.append(Usage_dict)
 
             print(f'Profile {prof_i - dummy_days +1}/{num_profiles_user} completed') #screen update about progress of computation
     
-    return(Profile, Usage, User_list, Profile_user, dummy_days)
\ No newline at end of file
+    return(Profile, Usage, User_list, Profile_user, dummy_days)
+
+
+#%% Peak time range
+
+def Peak_time_range(User_list, peak_enlarg, normal = random.normalvariate, enlarg_normal = random.gauss):
+    '''
+    Calculates the peak time range from the theoretical maximum curve of all the User classes. The peak time is drawn
+    with normal and its enlargement with enlarg_normal, which default to the generators of the loop engine
+    '''
+    
+    windows_curve = np.zeros(1440) #creates an empty daily profile
+    Tot_curve = np.zeros(1440) #creates another empty daily profile
+          
+    for Us in User_list:
+        for App in Us.App_list:
+            #Calculate windows curve, i.e. the theoretical maximum curve that can be obtained, for each app, by switching-on always all the 'n' apps altogether in any time-step of the functioning windows
+            windows_curve = windows_curve + App.daily_use*np.mean(App.POWER)*App.number #this sums the curve of the specific App to the overall curve comprising all the Apps within a User class
+        Us.windows_curve = windows_curve*Us.num_users #saves the overall User class theoretical maximum curve
+        Tot_curve = Tot_curve + Us.windows_curve #adds the User's theoretical max profile to the total theoretical max comprising all classes
+    peak_window = np.transpose(np.argwhere(Tot_curve == np.amax(Tot_curve))) #Find the peak window within the theoretical max profile
+    peak_time = round(normal(round(np.average(peak_window)),1/3*(peak_window[0,-1]-peak_window[0,0]))) #Within the peak_window, randomly calculate the peak_time using a gaussian distribution
+    peak_time_range = np.arange((peak_time-round(math.fabs(peak_time-(enlarg_normal(peak_time,(peak_enlarg*peak_time)))))),(peak_time+round(math.fabs(peak_time-enlarg_normal(peak_time,(peak_enlarg*peak_time)))))) #the peak_time is randomly enlarged based on the calibration parameter peak_enlarg
+    
+    return peak_time_range
+
+#%% Batched engine
+'''
+The batched engine simulates each day for all the users of a User class at once. For every Appliance, the random
+variables of the loop engine (occasional use, windows, distance, velocity and power) are drawn as arrays with one value
+per user. The switch-on events are then placed in rounds: at each round, every user that has not yet reached its total
+time of use draws one switch-on, which is accepted or rejected following the same rules as the loop engine.
+'''
+
+def Uniform(rng, low, high):
+    '''
+    Draws uniform values between low and high with a numpy random generator
+    '''
+    
+    low, high = np.broadcast_arrays(low, high)
+    
+    return low + (high - low)*rng.random(low.shape) #as random.uniform, also when high is lower than low
+
+def Rand_windows(App, n, rng):
+    '''
+    Randomises the start and ending times of the windows of an Appliance for n users
+    '''
+    
+    windows = np.array([App.window_1, App.window_2, App.window_3]) #start and ending times of the three windows of use
+    random_var = np.array([App.random_var_1, App.random_var_2, App.random_var_3])[:, None]
+    
+    rand_window = rng.uniform(windows - random_var, windows + random_var, (n, 3, 2)).astype(int) #users x windows x [start, end]
+    rand_window[:, :, 0] = np.maximum(rand_window[:, :, 0], 0)
+    rand_window[:, :, 1] = np.minimum(rand_window[:, :, 1], 1440)
+    
+    return rand_window
+
+def Free_spots_batch(rand_window):
+    '''
+    Merges the windows of each user into free spots [start, stop), as arrays of users x spots where empty spots have start = stop
+    '''
+    empty = rand_window[:, :, 1] <= rand_window[:, :, 0]
+    window_start = np.where(empty, 1440, rand_window[:, :, 0]) #empty windows are sorted last
+    order = np.argsort(window_start, axis = 1, kind = 'stable')
+    spot_start = np.take_along_axis(window_start, order, axis = 1)
+    spot_stop = np.take_along_axis(np.where(empty, 1440, rand_window[:, :, 1]), order, axis = 1)
+    for k in range(1, 3): #a window overlapping the previous spot is merged into it, and the merged spot is carried to the next column
+        overlap = (spot_start[:, k] <= spot_stop[:, k-1]) & (spot_stop[:, k] > spot_start[:, k])
+        spot_start[overlap, k] = spot_start[overlap, k-1]
+        spot_stop[overlap, k] = np.maximum(spot_stop[overlap, k-1], spot_stop[overlap, k])
+        spot_stop[overlap, k-1] = spot_start[overlap, k-1]
+    
+    return spot_start, spot_stop
+
+def Switch_on_batch(App, rand_window, rand_time, power, peak_time_range, mu_peak, s_peak, rng):
+    '''
+    Places the switch-on events of an Appliance for all its users and returns them as arrays of user, start, duration and power
+    '''
+    
+    n = len(rand_time)
+    events = []
+    spot_start, spot_stop = Free_spots_batch(rand_window) #free spots of the windows where the app is not yet on
+    n_spots = np.full(n, spot_start.shape[1])
+    
+    #control to check that the total randomised time of use does not exceed the total space available in the windows
+    window_time = np.diff(rand_window, axis = 2).sum(axis = (1, 2))
+    rand_time = np.where(rand_time > 0.99*window_time, (0.99*window_time).astype(int), rand_time)
+    tot_time = np.zeros(n, dtype = int)
+    max_free_spot = rand_time.copy()
+    active = (rand_time > 0) & (spot_stop > spot_start).any(axis = 1) #users that still need switch-on events
+    
+    if peak_time_range.size > 0:
+        peak_start, peak_end = peak_time_range[0], peak_time_range[-1] + 1
+    else:
+        peak_start, peak_end = 0, 0
+    
+    while active.any():
+        users = np.flatnonzero(active)
+        
+        #identifies a random switch on time within a random functioning window
+        w = rng.integers(0, min(App.num_windows, 3), users.size)
+        switch_on = Uniform(rng, rand_window[users, w, 0], rand_window[users, w, 1]).astype(int)
+        inside = (spot_start[users] <= switch_on[:, None]) & (switch_on[:, None] < spot_stop[users])
+        hit = inside.any(axis = 1) #if the app is already on at the selected time, the user tries again at the next round
+        users, switch_on, spot = users[hit], switch_on[hit], inside[hit].argmax(axis = 1)
+        
+        #the window of the switch-on, the first one if windows overlap, and the end of its free spot, i.e. the next time the app is already on or out of the windows
+        inside = (rand_window[users, :, 0] <= switch_on[:, None]) & (switch_on[:, None] < rand_window[users, :, 1])
+        window_end = rand_window[users, inside.argmax(axis = 1), 1]
+        next_switch = spot_stop[users, spot]
+        gap = next_switch - switch_on
+        obstacle = next_switch < window_end
+        
+        #if the next switch-on does not allow for a minimum functioning cycle, but there are other larger free spots, the user tries again
+        retry = obstacle & (gap < App.func_cycle) & (max_free_spot[users] >= App.func_cycle)
+        users, switch_on, spot, gap, obstacle, window_end = users[~retry], switch_on[~retry], spot[~retry], gap[~retry], obstacle[~retry], window_end[~retry]
+        
+        upper_limit = np.where(obstacle, np.where(max_free_spot[users] >= App.func_cycle, np.minimum(gap, rand_time[users]), gap),
+                               np.minimum(rand_time[users], window_end - switch_on))
+        duration = np.where(upper_limit >= App.func_cycle, rng.uniform(App.func_cycle, np.maximum(upper_limit, App.func_cycle)).astype(int), upper_limit)
+        
+        #the last switch-on is shortened to match the total time of use
+        tot_time[users] = tot_time[users] + duration
+        excess = tot_time[users] - rand_time[users]
+        duration = np.where(excess > 0, np.maximum(duration - excess, 0), duration)
+        tot_time[users] = np.minimum(tot_time[users], rand_time[users])
+        active[users[excess > 0]] = False
+        
+        #calculates coincident behaviour within and out of the peak time range, unless it is locked by the "fixed" attribute
+        if App.fixed == 'no':
+            peak = (duration > 0) & (switch_on < peak_end) & (switch_on + duration > peak_start)
+            on_peak = np.minimum(App.number, np.maximum(1, np.ceil(rng.normal(math.ceil(App.number*mu_peak), s_peak*App.number*mu_peak, users.size))))
+            Prob = rng.uniform(0, (App.number-1)/App.number, users.size)
+            off_peak = (np.arange(App.number)/App.number <= Prob[:, None]).sum(axis = 1)
+            coincidence = np.where(peak, on_peak, off_peak)
+        else:
+            coincidence = App.number
+        switch_power = power[users]*rng.uniform(1-App.P_var, 1+App.P_var, users.size)*coincidence #randomises also the App Power if P_var is on
+        
+        #the free spot of each switch-on event ends at the switch-on, and the part after the event becomes a new spot
+        on = duration > 0
+        users, switch_on, spot, duration = users[on], switch_on[on], spot[on], duration[on]
+        events.append((users, switch_on, duration, switch_power[on]))
+        if users.size > 0 and n_spots[users].max() == spot_start.shape[1]:
+            spot_start = np.pad(spot_start, ((0, 0), (0, spot_start.shape[1])))
+            spot_stop = np.pad(spot_stop, ((0, 0), (0, spot_stop.shape[1])))
+        spot_start[users, n_spots[users]] = switch_on + duration
+        spot_stop[users, n_spots[users]] = spot_stop[users, spot]
+        spot_stop[users, spot] = switch_on
+        n_spots[users] += 1
+        max_free_spot[users] = (spot_stop[users] - spot_start[users]).max(axis = 1)
+        active[users] &= max_free_spot[users] > 0
+    
+    if not events:
+        return (np.zeros(0, dtype = int), np.zeros(0, dtype = int), np.zeros(0, dtype = int), np.zeros(0))
+    return tuple(np.concatenate(column) for column in zip(*events))
+
+def User_class_batch(Us, day_type, peak_time_range, mu_peak, s_peak, rng, profiles = None):
+    '''
+    Simulates one day for all the users of a User class and returns the trip events as arrays of user, start, duration
+    and power. If given, their daily profiles are also added to profiles (users x 1440)
+    '''
+    
+    n = Us.num_users
+    events = []
+    Us.load = np.zeros(1440)
+    Us.usage = np.zeros(1440)
+    
+    if Us.user_preference == 0:
+        rand_daily_pref = np.zeros(n, dtype = int)
+    else:
+        rand_daily_pref = rng.integers(1, Us.user_preference + 1, n)
+    
+    for App in Us.App_list:
+        if App.activate > 0:
+            raise ValueError(f"[WARNING] Duty cycles of '{Us.user_name}' appliances are only modelled by the 'loop' engine")
+        if not (App.wd_we == day_type or App.wd_we == 3): #checks if the app is allowed in the given yearly behaviour pattern
+            continue
+        
+        users = rng.uniform(0, 1, n) <= App.occasional_use #evaluates if occasional use happens or not
+        if App.Pref_index != 0:
+            users &= rand_daily_pref == App.Pref_index #evaluates if daily preference coincides with the randomised daily preference number
+        users = np.flatnonzero(users)
+        
+        #Define all the variables here, with their variability
+        rand_window = Rand_windows(App, users.size, rng)
+        
+        random_var_v = rng.uniform((1-App.r_v), (1+App.r_v), users.size)
+        random_var_d = rng.uniform((1-App.r_d), (1+App.r_d), users.size)
+        
+        rand_dist = np.round(Uniform(rng, App.dist_tot, np.trunc(App.dist_tot*random_var_d)))
+        
+        App.vel = App.func_dist/App.func_cycle * 60
+        
+        rand_vel = np.maximum(20, np.round(Uniform(rng, App.vel, np.trunc(App.vel*random_var_v)))) #average velocity of the trip, minimum value is 20 km/h to get reasonable values from the power curve
+        
+        rand_time = np.round(rand_dist/rand_vel * 60).astype(int) #total time based on total distance and average velocity
+        
+        power = (App.Par_power[0] * rand_vel**2 + App.Par_power[1] * rand_vel + App.Par_power[2]) * 12
+        
+        if App.flat == 'yes': #if the app is "flat" the newly created windows are filled without applying any further stochasticity
+            minutes = np.arange(1440)
+            in_windows = ((minutes >= rand_window[:, :, :1]) & (minutes < rand_window[:, :, 1:])).any(axis = 1)
+            Us.load = Us.load + (in_windows * (power*App.number)[:, None]).sum(axis = 0)
+            continue
+        
+        app_users, start, duration, switch_power = Switch_on_batch(App, rand_window, rand_time, power, peak_time_range, mu_peak, s_peak, rng)
+        app_users = users[app_users]
+        events.append((app_users, start, duration, switch_power))
+        
+        minutes = event_minutes(start, duration)
+        minute_power = np.repeat(switch_power, duration)
+        if profiles is not None: #the events of an App never overlap, so they can be put in the profiles at once
+            profiles[np.repeat(app_users, duration), minutes] += minute_power
+        Us.load = Us.load + np.bincount(minutes, weights = minute_power, minlength = 1440) #adds the App profile to the User load
+        Us.usage = Us.usage + np.bincount(minutes[minute_power > 0.1], minlength = 1440) #adds the App usage to the User usage profile
+    
+    if not events:
+        return (np.zeros(0, dtype = int), np.zeros(0, dtype = int), np.zeros(0, dtype = int), np.zeros(0))
+    return tuple(np.concatenate(column) for column in zip(*events))
+
+def Day_batch(User_list, day_type, peak_time_range, mu_peak, s_peak, rng, Profile_dict = None):
+    '''
+    Simulates one day for all the User classes and returns the totals and the trip events of each class. If given, the user
+    profiles are also written in Profile_dict (users x 1440 for each class)
+    '''
+    
+    Tot_Classes = np.zeros(1440) #sum of the profiles of each User instance
+    Tot_Usage = np.zeros(1440) #sum of the usage of each User instance
+    Events_dict = {}
+    for Us in User_list:
+        profiles = Profile_dict[Us.user_name] if Profile_dict is not None else None
+        Events_dict[Us.user_name] = User_class_batch(Us, day_type, peak_time_range, mu_peak, s_peak, rng, profiles)
+        Tot_Classes = Tot_Classes + Us.load
+        Tot_Usage = Tot_Usage + Us.usage
+    
+    return (Tot_Classes, Tot_Usage, Events_dict)
+
+def Days_batch(User_list, day_types, peak_time_range, mu_peak, s_peak, seeds, Profile_user = None, dtype = 'float64', events = False):
+    '''
+    Simulates consecutive days, each with its own random generator, and returns the totals of each day with the user profiles.
+    These are written in Profile_user (users x minutes of the days for each class), created in a worker process, or are
+    returned as arrays of user, day, start, duration and power of the trip events if events is True
+    '''
+    if Profile_user is None and not events:
+        Profile_user = {Us.user_name: np.zeros((Us.num_users, len(day_types)*1440), dtype = dtype) for Us in User_list}
+    
+    week = []
+    week_events = {Us.user_name: [] for Us in User_list}
+    for day, (day_type, day_seed) in enumerate(zip(day_types, seeds)):
+        if events:
+            Profile_dict = None
+        else:
+            Profile_dict = {name: profiles[:, day*1440:(day+1)*1440] for name, profiles in Profile_user.items()}
+        Tot_Classes, Tot_Usage, Events_dict = Day_batch(User_list, day_type, peak_time_range, mu_peak, s_peak, np.random.default_rng(day_seed), Profile_dict)
+        week.append((Tot_Classes, Tot_Usage))
+        if events:
+            for name, (users, start, duration, power) in Events_dict.items():
+                week_events[name].append((users, np.full(users.size, day), start, duration, power.astype(dtype)))
+    
+    if events:
+        return (week, {name: tuple(np.concatenate(column) for column in zip(*days)) for name, days in week_events.items()})
+    return (week, Profile_user)
+
+def Events_table(events, minutes):
+    '''
+    Builds the table of trip events of a User class, sorted by user, day and start, from arrays of user, day, start, duration and power
+    '''
+    users, days, start, duration, power = events
+    order = np.lexsort((start, days, users))
+    table = pd.DataFrame({'user': users[order].astype(np.int32), 'day': days[order].astype(np.int16), 'start': start[order].astype(np.int16),
+                          'duration': duration[order].astype(np.int16), 'power': power[order]})
+    table.attrs['minutes'] = minutes #number of simulated minutes, which the events do not give
+    
+    return table
@@ -9,7 +9,7 @@ import copy
 import matplotlib.ticker as mtick
 from pathlib import Path
 import pickle
-from ramp_mobility.utils import tot_users_calc, tot_battery_cap_calc
+from ramp_mobility.utils import tot_users_calc, tot_battery_cap_calc, profile_minutes
 
 
 # from initialise import tot_users_calc, tot_battery_cap_calc
@@ -39,16 +39,14 @@ def Profile_formatting(stoch_profiles):
     return (Profile_avg, Profile_kW, Profile_series)
 
 def Profiles_user_formatting(stoch_profiles):
+    # The profiles of each user type are already stacked as users x minutes, they are viewed as minutes x users without copies
+    # Trip events are already in their final format
     Profiles_user_format = {}
-    for us_type in stoch_profiles[0]:
-        Profiles_user_format[us_type] = []
-        for day in range(len(stoch_profiles)):
-            try:
-                temp = np.stack(stoch_profiles[day][us_type], axis=-1)
-            except:
-                temp = np.zeros((1440,1))
-            Profiles_user_format[us_type].append(temp)
-        Profiles_user_format[us_type] = np.vstack(Profiles_user_format[us_type])
+    for us_type in stoch_profiles:
+        if isinstance(stoch_profiles[us_type], pd.DataFrame):
+            Profiles_user_format[us_type] = stoch_profiles[us_type]
+        else:
+            Profiles_user_format[us_type] = stoch_profiles[us_type].T
     return Profiles_user_format
 
 def Usage_formatting(stoch_profiles):
@@ -295,7 +293,7 @@ def Profile_temp(Profiles_df, temp_profile,  year = 2016):
 def Profile_temp_users(Profiles_user, temp_profile,  year = 2016, dummy_days = 1):
 
     start_day = dt.datetime(year, 1, 1) - dt.timedelta(days=dummy_days)
-    n_periods = len(Profiles_user['Working - Large car'])
+    n_periods = profile_minutes(Profiles_user['Working - Large car'])
     
     minutes_sim = pd.date_range(start=start_day, periods = n_periods, freq='T')
         
@@ -313,10 +311,40 @@ def Profile_temp_users(Profiles_user, temp_profile,  year = 2016, dummy_days = 1
     Profiles_user_temp = {}
     
     for user in Profiles_user: 
-        Profiles_user_temp[user] = Profiles_user[user] * temp_coeff.values
+        if isinstance(Profiles_user[user], pd.DataFrame): # Trip events
+            Profiles_user_temp[user] = Events_temp(Profiles_user[user], temp_coeff.values[:, 0])
+        else:
+            Profiles_user_temp[user] = Profiles_user[user] * temp_coeff.values.astype(Profiles_user[user].dtype) # Keeps the precision of the profiles
             
     return Profiles_user_temp
 
+def Events_temp(events, coeff):
+    # Splits the trip events where the temperature coefficient changes, and scales the power of each piece by its coefficient
+    
+    start = events['day'].values.astype(np.int64) * 1440 + events['start'].values
+    end = start + events['duration'].values
+    
+    breaks = np.flatnonzero(np.diff(coeff)) + 1 # Minutes in which the coefficient changes
+    first = np.searchsorted(breaks, start, side = 'right') # First break after the start of each event
+    n_pieces = np.searchsorted(breaks, end, side = 'left') - first + 1
+    
+    rows = np.repeat(np.arange(len(events)), n_pieces)
+    piece = np.arange(n_pieces.sum()) - np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces) # Piece number within its event
+    cut = breaks[np.minimum(first[rows] + piece, len(breaks) - 1)] if len(breaks) else np.zeros(len(rows), dtype = np.int64)
+    piece_start = np.where(piece == 0, start[rows], np.roll(cut, 1))
+    piece_end = np.where(piece == n_pieces[rows] - 1, end[rows], cut)
+    
+    events_temp = pd.DataFrame({
+        'user': events['user'].values[rows],
+        'day': (piece_start // 1440).astype(events['day'].dtype),
+        'start': (piece_start % 1440).astype(events['start'].dtype),
+        'duration': (piece_end - piece_start).astype(events['duration'].dtype),
+        'power': events['power'].values[rows] * coeff[piece_start].astype(events['power'].dtype), # Keeps the precision of the profiles
+        })
+    events_temp.attrs = events.attrs
+    
+    return events_temp
+
 def Time_correction(df, country, year):
     
     df_c = copy.deepcopy(df)   
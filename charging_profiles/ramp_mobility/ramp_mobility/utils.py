@@ -101,6 +101,32 @@ def residual_load(minutes, residual_load, year, country):
     
     return res_load_neg_ind
     
+def event_minutes(start, duration):
+    # Minutes covered by each trip event, one after the other
+    
+    return np.repeat(start - np.cumsum(duration) + duration, duration) + np.arange(duration.sum())
+
+def events_power(events, n_periods):
+    # Power consumed by each user with at least one trip event, negative and in kW as the minute profiles in the charging process
+    
+    users = events['user'].values
+    minute = events['day'].values.astype(np.int64) * 1440 + events['start'].values
+    duration = events['duration'].values.astype(np.int64)
+    
+    for rows in np.split(np.arange(len(events)), np.flatnonzero(np.diff(users)) + 1): # The events are sorted by user
+        if rows.size == 0:
+            continue
+        power = np.bincount(event_minutes(minute[rows], duration[rows]), weights = np.repeat(events['power'].values[rows], duration[rows]), minlength = n_periods)
+        power = np.where(power < 0.1, 0, power) 
+        yield np.where(power > 0, -power, 0) / 1000
+
+def profile_minutes(Profile_user):
+    # Number of simulated minutes of the profiles of a user class, given as minutes x users or as trip events
+    
+    if isinstance(Profile_user, pd.DataFrame):
+        return Profile_user.attrs['minutes']
+    return len(Profile_user)
+
 def tot_users_calc(User_list):
     # Calculation of the total number of users
     num_users = {}
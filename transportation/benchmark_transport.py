@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Benchmarks compile_transport.py on synthetic CANOE-TRN workbooks of increasing size
+
+The synthetic workbooks follow the layouts of the spreadsheet database (title row and header row, parameter
+columns up to last_col followed by input calculations), scaled by the number of techs, existing vintages and
+future periods. Each run is timed end to end and per compile step, and appended to a results file so that
+runs of different versions of the compiler can be compared.
+
+Usage
+-----
+python benchmark_transport.py --techs 100 200 400 800 --label my-change
+python benchmark_transport.py --compare baseline my-change
+"""
+import argparse
+import contextlib
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import compile_transport as ct
+
+techs = [100, 200, 400]     # number of technologies of each benchmarked workbook
+vintages = 21               # existing vintages, ending in 2020 (2000-2020)
+periods = 7                 # future periods every 5 years from 2021 (2021, 2025, ..., 2050)
+repeats = 3                 # compiles timed per workbook
+
+dir_path = os.path.dirname(os.path.abspath(__file__)) + '/'
+results_path = dir_path + 'benchmark_results/results.csv'
+
+dqi = ['Reliability', 'Representativeness', 'Temporal', 'Geographical', 'Technological']
+
+
+"""
+##################################################
+    Synthetic workbook
+##################################################
+"""
+
+def sheet_frame(header, rows, title=True, extra=True):
+    """
+    Lays out a sheet as the spreadsheet database does: a title row (unless title=False), the header row and the data rows,
+    followed by a blank column and input calculation columns past last_col
+    """
+    rows = pd.DataFrame(rows, columns=header)
+    if extra:
+        rows[None] = np.nan
+        rows['Input calculations'] = 'calculation'
+    raw = [rows.columns.tolist()] + rows.values.tolist()
+    if title: raw = [['Model input'] + [None] * (rows.shape[1] - 1)] + raw
+    return pd.DataFrame(raw)
+
+def synthetic_workbook(path, n_techs, n_vintages=vintages, n_periods=periods, seed=0):
+    """
+    Writes a synthetic CANOE-TRN workbook with n_techs technologies, half existing (_EX) and half new (_N)
+    """
+    rng = np.random.default_rng(seed)
+
+    existing = [str(v) for v in range(2021 - n_vintages, 2021)]
+    future = [str(2021 + 4 * (p > 0) + 5 * max(p - 1, 0)) for p in range(n_periods)]
+    quinquennial = [v for v in existing if int(v) % 5 == 0]
+
+    n_ex = n_techs // 2
+    tech_ex = [f'T_BM_{i:04d}_EX' for i in range(n_ex)]
+    tech_new = [f'T_BM_{i:04d}_N' for i in range(n_techs - n_ex)]
+    tech_all = tech_ex + tech_new
+    fuels = [f'T_fuel_{k}' for k in range(max(2, n_techs // 20))]
+    demands = [f'T_D_{k}' for k in range(max(1, n_techs // 10))]
+    fuel = {t: fuels[i % len(fuels)] for i, t in enumerate(tech_all)}
+    demand = {t: demands[i % len(demands)] for i, t in enumerate(tech_all)}
+
+    references = [f'Author {i} et al. ({2015 + i % 10}). Transportation data – table {i}. Agency’s report.' for i in range(max(10, n_techs // 5))]
+    ref = lambda i: references[i % len(references)]
+    meta = lambda i: [ref(i), 2015 + i % 10] #  Reference and Data Year
+    dq = lambda i: [f'Synthetic note {i % 7}'] + [1 + (i + k) % 5 for k in range(5)] #  Notes and DQIs
+    values = lambda n, scale: (rng.random(n) * scale + scale / 10).round(6).tolist()
+    region = ct.province
+
+    sheets = {}
+    sheets['References'] = sheet_frame(['References'], [[r] for r in references], title=False, extra=False)
+    sheets['Techs'] = sheet_frame(['Technology', 'Flag', 'Description', 'Details', 'Category'],
+        [[t, 'p', f'Synthetic technology {t}', '', 'Cars'] for t in tech_all + ['T_BM_CHRG']], title=False)
+    sheets['Comms'] = sheet_frame(['Commodity', 'Flag', 'Description', 'Details'],
+        [[c, 'p', f'Synthetic fuel {c}', 'PJ'] for c in fuels] + [[c, 'd', f'Synthetic demand {c}', 'bpkm'] for c in demands] +
+        [[c, 'e', f'{c} emissions', 'kt'] for c in ['co2', 'ch4', 'n2o']], title=False)
+
+    sheets['Demand'] = sheet_frame(['Demand Commodity', 'Region', 'Reference', 'Data Year', 'Unit'] + future + ['Notes'] + dqi,
+        [[d, region, *meta(i), 'bpkm'] + values(len(future), 100) + dq(i) for i, d in enumerate(demands)])
+    sheets['DemandDist'] = sheet_frame(['Technology', 'Region', 'Reference', 'Data Year', 'Notes'] + dqi,
+        [['T_BM_CHRG', region, *meta(0), *dq(0)]])
+    sheets['Lifetime'] = sheet_frame(['Technology', 'Region', 'Reference', 'Data Year', 'Unit', 'Lifetime', 'Notes'] + dqi,
+        [[t, region, *meta(i), 'Years', int(rng.integers(10, 25))] + dq(i) for i, t in enumerate(tech_all)])
+
+    # Existing vintages of existing techs start at random years, as vehicle classes appear over time
+    start = rng.integers(0, max(len(existing) - 3, 1), len(tech_ex))
+    sheets['ExCap'] = sheet_frame(['Technology', 'Region', 'Reference', 'Data Year', 'Unit'] + existing + [None, 'Notes'] + dqi,
+        [[t, region, *meta(i), 'k units'] + [v if j >= start[i] else None for j, v in enumerate(values(len(existing), 100))] + [None] + dq(i)
+         for i, t in enumerate(tech_ex)])
+    sheets['Cap2Act'] = sheet_frame(['Technology', 'Region', 'Capacity Unit', 'Activity Unit', 'Capacity to Activity', None, 'Notes'],
+        [[t, region, 'k units', 'bpkm', round(float(rng.random()) + 1, 3), None, f'Synthetic note {i % 7}'] for i, t in enumerate(tech_all)])
+    sheets['CapFactor'] = sheet_frame(['Technology', 'Output Commodity', 'Region', 'Reference', 'Data Year'] + future + ['Notes'],
+        [[t, demand[t], region, *meta(i)] + values(len(future), 0.05) + [f'Synthetic note {i % 7}'] for i, t in enumerate(tech_all)])
+    sheets['Efficiency'] = sheet_frame(['Technology', 'Input Commodity', 'Output Commodity', 'Region', 'Reference', 'Data Year', 'Unit'] + existing + future + [None, 'Notes'] + dqi,
+        [[t, fuel[t], demand[t], region, *meta(i), 'bpkm/PJ'] + [v if j >= start[i] else None for j, v in enumerate(values(len(existing), 1))] + [None] * len(future) + [None] + dq(i)
+         for i, t in enumerate(tech_ex)] +
+        [[t, fuel[t], demand[t], region, *meta(i), 'bpkm/PJ'] + [None] * len(existing) + values(len(future), 1) + [None] + dq(i)
+         for i, t in enumerate(tech_new)])
+
+    currency = lambda i: [2020 + i % 3, 'USD', 1.3, 2020, 'CAD'] #  Original Currency Year, Original Currency, Conversion Factor, Currency Year, Currency
+    sheets['CostInvest'] = sheet_frame(['Technology', 'Region', 'Reference', 'Data Year', 'Original Currency Year', 'Original Currency', 'Conversion Factor', 'Currency Year', 'Currency', 'Unit'] + future + ['Notes'] + dqi,
+        [[t, region, *meta(i), *currency(i), 'M$/k units'] + values(len(future), 30) + dq(i) for i, t in enumerate(tech_new)])
+
+    # Variable and fixed costs have one row per period, with a cost for each vintage active in that period
+    cost_rows = []
+    for i, t in enumerate(tech_all):
+        for period in future:
+            if t in tech_new: costs = [None] * len(quinquennial) + [v if int(f) <= int(period) else None for f, v in zip(future, values(len(future), 50))]
+            else: costs = values(len(quinquennial), 50) + [None] * len(future)
+            cost_rows.append([t, region, *meta(i), *currency(i), 'M$/bpkm', int(period)] + costs + dq(i))
+    cost_header = ['Technology', 'Region', 'Reference', 'Data Year', 'Original Currency Year', 'Original Currency', 'Conversion Factor', 'Currency Year', 'Currency', 'Unit', 'Period'] + quinquennial + future + ['Notes'] + dqi
+    sheets['CostVariable'] = sheet_frame(cost_header, cost_rows)
+    sheets['CostFixed'] = sheet_frame(cost_header, cost_rows)
+
+    emissions = ['co2', 'ch4', 'n2o']
+    sheets['EmissionAct'] = sheet_frame(['Technology', 'Input Commodity', 'Output Commodity', 'Emission Commodity', 'Region', 'Reference', 'Data Year', 'Unit'] + future[:2] + ['Notes'] + dqi,
+        [[t, fuel[t], demand[t], e, region, *meta(i), 'kt/PJ'] + values(2, 20) + dq(i) for i, t in enumerate(tech_new) for e in emissions])
+    sheets['EmissionEmb'] = sheet_frame(['Technology', 'Emission Commodity', 'Region', 'Reference', 'Data Year', 'Unit', '2021', 'Notes'] + dqi,
+        [[t, 'co2', region, *meta(i), 'ktCO2/k units'] + values(1, 10) + dq(i) for i, t in enumerate(tech_new)])
+    sheets['InputSplit'] = sheet_frame(['Technology', 'Region', 'Reference', 'Data Year', 'Input Commodity', 'Output Commodity'] + future + ['Notes'] + dqi,
+        [[t, region, *meta(i), fuel[t], demand[t]] + values(len(future), 1) + dq(i) for i, t in enumerate(tech_new[:max(1, len(tech_new) // 10)])])
+
+    with pd.ExcelWriter(path) as writer:
+        for sheet, df in sheets.items(): df.to_excel(writer, sheet_name=sheet, header=False, index=False)
+
+def synthetic_profile(path, year=ct.weather_year):
+    """
+    Writes a synthetic RAMP-mobility charging profile at 15-minute resolution (UTC) covering the weather year
+    """
+    index = pd.date_range(f'{year - 1}-12-31', f'{year + 1}-01-02', freq='15min', tz='UTC')
+    hours = index.hour + index.minute / 60
+    profile = 1 + np.sin((hours - 6) / 24 * 2 * np.pi) + np.random.default_rng(0).random(len(index)) / 10
+    pd.DataFrame({'Charging Profile': profile}, index=index).to_csv(path)
+
+
+"""
+##################################################
+    Benchmark runs
+##################################################
+"""
+
+def git_commit():
+    """
+    Short hash of the checked out commit, to tell benchmark runs apart
+    """
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=dir_path, capture_output=True, text=True).stdout.strip()
+    except OSError: return ''
+
+def benchmark(techs=techs, vintages=vintages, periods=periods, repeats=repeats, label=None, workers=None):
+    """
+    Compiles synthetic workbooks of each size, timing the compile end to end and per step, and appends the timings to the results file
+    """
+    label = label or git_commit() or 'unlabelled'
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_profile(tmp + '/profile.csv')
+        ct.ldv_profile = tmp + '/profile.csv'
+        ct.charging_dsd, ct.wipe_database, ct.cache_tables = False, True, False
+        if workers: ct.compile_workers = workers
+
+        for n in techs:
+            ct.spreadsheet = f'{tmp}/CANOE_TRN_BM_{n}.xlsx'
+            synthetic_workbook(ct.spreadsheet, n, vintages, periods)
+
+            for r in range(repeats):
+                ct.database = f'{tmp}/canoe_trn_bm_{n}_{r}.sqlite'
+                ct.workbooks.clear() #  Every compile parses its workbook, as a fresh session would
+
+                start = time.perf_counter()
+                with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f): ct.compile_transport()
+                seconds = time.perf_counter() - start
+
+                run = {'label': label, 'timestamp': timestamp, 'commit': git_commit(), 'techs': n, 'vintages': vintages, 'periods': periods, 'repeat': r}
+                steps = pd.DataFrame(ct.step_stats).groupby('step', sort=False).agg(seconds=('seconds', 'sum'), rows_written=('rows_written', 'max'))
+                results += [dict(run, step=step, seconds=s.seconds, rows_written=s.rows_written) for step, s in steps.iterrows()]
+                results.append(dict(run, step='total', seconds=seconds, rows_written=steps['rows_written'].sum()))
+
+    df = pd.DataFrame(results)
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    df.to_csv(results_path, mode='a', header=not os.path.exists(results_path), index=False)
+
+    print_scaling(df)
+    print(f"Results of {label} appended to {os.path.relpath(results_path, dir_path)}")
+    return df
+
+def print_scaling(df):
+    """
+    Prints the median compile time per workbook size, and the time per thousand rows written to check the compile scales linearly
+    """
+    total = df[df['step'] == 'total'].groupby(['label', 'techs'])[['seconds', 'rows_written']].median()
+    total['ms per 1000 rows'] = (total['seconds'] / total['rows_written'] * 1e6).round(2)
+    print("Compile time by workbook size (median of repeats):")
+    print(total.round(3).to_string(), "\n")
+
+    steps = df[df['step'] != 'total'].pivot_table(index='step', columns='techs', values='seconds', aggfunc='median', sort=False)
+    print("Median seconds per step:")
+    print(steps.round(3).to_string(), "\n")
+
+def compare(labels):
+    """
+    Compares the stored runs of several labels, by median total and per step time for each workbook size
+    """
+    df = pd.read_csv(results_path)
+    df = df[df['label'].astype(str).isin(labels)]
+    table = df.pivot_table(index=['techs', 'step'], columns='label', values='seconds', aggfunc='median', sort=False)[labels]
+    if len(labels) > 1: table[f'{labels[-1]} / {labels[0]}'] = table[labels[-1]] / table[labels[0]]
+    print(table.round(3).to_string())
+    return table
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("--techs", type=int, nargs="+", default=techs,
+                   help=f"Number of technologies of each synthetic workbook (default: {techs})")
+    p.add_argument("--vintages", type=int, default=vintages,
+                   help=f"Number of existing vintages up to 2020 (default: {vintages})")
+    p.add_argument("--periods", type=int, default=periods,
+                   help=f"Number of future periods from 2021 (default: {periods})")
+    p.add_argument("--repeats", type=int, default=repeats,
+                   help=f"Compiles timed per workbook (default: {repeats})")
+    p.add_argument("--workers", type=int, default=None,
+                   help="compile_workers used by the compiles (default: compile_transport's setting)")
+    p.add_argument("--label", default=None,
+                   help="Label of the stored results (default: current git commit)")
+    p.add_argument("--compare", nargs="+", metavar="LABEL",
+                   help="Compare stored results of these labels instead of running the benchmark")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare: compare(args.compare)
+    else: benchmark(args.techs, args.vintages, args.periods, args.repeats, args.label, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compiles the CANOE-TRN spreadsheets of several provinces in parallel, each into its own database, using compile_transport.py
+
+Usage
+-----
+python compile_provinces.py QC MB SK AB BCT --workers 4 \
+                            --spreadsheet CANOE_TRN_<r>_v4 --db canoe_trn_<r>_vanilla4
+"""
+import argparse
+import contextlib
+import os
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import compile_transport as ct
+
+province_list = ['QC', 'MB', 'SK', 'AB', 'BCT']    # ON is compiled with the settings of compile_transport.py by default
+spreadsheet_name = 'CANOE_TRN_<r>_v4'          # <r> is replaced by the province code
+db_name = 'canoe_trn_<r>_vanilla4'              # <r> is replaced by the lowercase province code
+ldv_profile_name = ct.ldv_profile_name          # RAMP-mobility results shared by all provinces unless it contains <r>
+
+dir_path = os.path.dirname(os.path.abspath(__file__)) + '/'
+log_path = dir_path + 'compiled_database/logs/'
+
+# Outputs of compile_transport.py shared by all provinces, which are given the database name of each province
+v3_path = os.path.dirname(ct.v3_database) + '/'
+report_path = ct.report_path
+validation_path = ct.validation_path
+
+
+def province_path(path, db):
+    """
+    Inserts the database name of a province into an output path shared by all provinces, keeping its extension
+    """
+    if not path: return path
+    ext = '.trace.json' if path.endswith('.trace.json') else os.path.splitext(path)[1]
+    return path[:len(path) - len(ext)] + '_' + db + ext
+
+
+def configure(province, spreadsheet_name, db_name, ldv_profile_name):
+    """
+    Points the compile_transport settings to the files of the given province
+    """
+    ct.province = province
+    ct.spreadsheet = ct.dir_path + 'spreadsheet_database/' + spreadsheet_name.replace('<r>', province) + '.xlsx'
+    ct.database = ct.dir_path + 'compiled_database/' + db_name.replace('<r>', province.lower()) + '.sqlite'
+    ct.ldv_profile = ct.dir_path + '../charging_profiles/ramp_mobility/results/' + ldv_profile_name.replace('<r>', province) + '.csv'
+    db = db_name.replace('<r>', province.lower())
+    ct.v3_database = v3_path + db + '_v3.sqlite'
+    ct.report_path = province_path(report_path, db)
+    ct.validation_path = province_path(validation_path, db)
+    ct.compile_workers = 1 #  Provinces are already compiled in parallel
+
+
+def row_counts(database):
+    """
+    Returns the number of rows of each non-empty table of a database
+    """
+    with contextlib.closing(sqlite3.connect(database)) as conn:
+        tables = [t for (t,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        counts = {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+    return {t: n for t, n in counts.items() if n > 0}
+
+
+def compile_province(province, spreadsheet_name=spreadsheet_name, db_name=db_name, ldv_profile_name=ldv_profile_name):
+    """
+    Compiles one province into its own database, writing the compile output to a per-province log file
+    """
+    configure(province, spreadsheet_name, db_name, ldv_profile_name)
+    os.makedirs(os.path.dirname(ct.database), exist_ok=True)
+    os.makedirs(log_path, exist_ok=True)
+    log = log_path + os.path.splitext(os.path.basename(ct.database))[0] + '.log'
+
+    status, rows = 'ok', {}
+    start = time.perf_counter()
+    with open(log, 'w') as f, contextlib.redirect_stdout(f), contextlib.redirect_stderr(f):
+        try:
+            ct.compile_transport()
+        except Exception:
+            traceback.print_exc()
+            status = 'failed'
+    seconds = time.perf_counter() - start
+
+    if status == 'ok': rows = row_counts(ct.database)
+
+    return {
+        'province': province,
+        'database': os.path.basename(ct.database),
+        'status': status,
+        'seconds': round(seconds, 2),
+        'tables': len(rows),
+        'rows': sum(rows.values()),
+        'log': os.path.relpath(log, dir_path),
+    }
+
+
+def compile_provinces(provinces=province_list, spreadsheet_name=spreadsheet_name, db_name=db_name,
+                      ldv_profile_name=ldv_profile_name, workers=None):
+    """
+    Compiles each province in a separate process and returns a summary table of timings and row counts
+    """
+    workers = min(workers or os.cpu_count(), len(provinces))
+    n = len(provinces)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(compile_province, provinces, [spreadsheet_name]*n, [db_name]*n, [ldv_profile_name]*n))
+
+    summary = pd.DataFrame(results).set_index('province')
+    print(summary.to_string())
+    print(f"\nCompiled {(summary['status'] == 'ok').sum()} of {n} provinces in {time.perf_counter() - start:.1f} s using {workers} processes")
+
+    return summary
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("provinces", nargs="*", default=province_list,
+                   help=f"Provinces to compile (default: {' '.join(province_list)})")
+    p.add_argument("--spreadsheet", default=spreadsheet_name,
+                   help=f"Spreadsheet name, <r> is replaced by the province (default: {spreadsheet_name})")
+    p.add_argument("--db", default=db_name,
+                   help=f"Database name, <r> is replaced by the lowercase province (default: {db_name})")
+    p.add_argument("--profile", default=ldv_profile_name,
+                   help=f"RAMP-mobility results name, <r> is replaced by the province (default: {ldv_profile_name})")
+    p.add_argument("--workers", type=int, default=None,
+                   help="Number of worker processes (default: one per CPU, at most one per province)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    summary = compile_provinces(args.provinces, args.spreadsheet, args.db, args.profile, args.workers)
+    if (summary['status'] != 'ok').any():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,16 @@ import os
 from datetime import datetime
 import re
 import unicodedata
+import hashlib
+import json
+import contextlib
+import functools
+import time
+import cProfile
+import pstats
+import tracemalloc
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 province = 'ON'
 
@@ -34,6 +44,7 @@ spreadsheet = dir_path + 'spreadsheet_database/' + spreadsheet_name + '.xlsx'
 # RAMP-mobility simulation results to compile
 ldv_profile = dir_path + '../charging_profiles/ramp_mobility/results/' + ldv_profile_name + '.csv'
 weather_year = 2018
+time_zone = 'America/Toronto'  # local time zone of the charging profiles
 charging_dsd = False       # choose whether to represent LD EV charging demand distribution in the DSD (True) or CFT (False) Temoa tables
 
 # Aggregate existing capacities and efficiencies into 5-year vintages
@@ -49,40 +60,378 @@ convert_emission_units = True
 epsilon = 1e-4  # For cleaning existing capacities that are too small
 precision = 9   # For consistent precision across the model
 
-# Rewrite database from scratch if it already exists
+# Rewrite database from scratch if it already exists, otherwise only rebuild the tables whose inputs changed since the last compile
+# The input hashes of the last compile are kept next to the database, in <database>.inputs.json, so that it only holds schema tables
 wipe_database = True
 
+# SQLite pragmas for bulk loading; the whole compile is committed once at the end
+sqlite_pragmas = {
+    'journal_mode': 'MEMORY',   # Rollback journal kept in memory; a failed compile still rolls back
+    'synchronous': 'OFF',       # No intermediate fsyncs, the database is written once on commit
+    'cache_size': -262144,      # Page cache size in KiB (256 MB)
+    'temp_store': 'MEMORY',
+}
+
+# Cache the tables written by each compile step as Parquet files, keyed by the hash of the step inputs (requires pyarrow)
+# Steps whose inputs were compiled before are bulk loaded from the cache, and downstream tools can read the tables with cached_tables()
+cache_tables = False
+cache_path = dir_path + 'compiled_cache/'
+
+# Build the database in memory and write it to disk at once with an atomic rename, instead of writing into the database file
+build_in_memory = True
+
+# Also write the database in the Temoa v3 schema, migrated from the compiled tables in memory (as db_processing/to_temoa_v3 does from a copy)
+temoa_v3 = False
+v3_migration = dir_path + '../db_processing/to_temoa_v3/temoa_v2_to_v3.txt'
+v3_database = dir_path + '../db_processing/to_temoa_v3/v3_database/' + db_name + '_v3.sqlite'
+
+# Instrumentation: wall time, rows read and rows written of each step are reported at the end of every compile
+trace_memory = os.environ.get('CANOE_TRACE_MEMORY') == '1'  # also trace peak memory per step (slower, steps then run serially)
+report_path = os.environ.get('CANOE_REPORT')                # write the step report as JSON, or as a Chrome trace if it ends with .trace.json
+profile_steps = [step for step in os.environ.get('CANOE_PROFILE', '').split(',') if step] # steps to run under cProfile, or 'all'
+
+# Worker processes parsing the spreadsheet sheets and worker threads transforming them (1 to compile serially)
+compile_workers = os.cpu_count()
+
+# Check the spreadsheet for duplicate keys, unknown techs and commodities and entries outside process lifetimes before writing anything
+validate_inputs = True
+strict_validation = False                               # stop the compile if the validation finds issues
+validation_path = os.environ.get('CANOE_VALIDATION')    # also write every issue found as CSV
+
 """
 ##################################################
     Initial setup
 ##################################################
 """
 
+class Workbook:
+    """
+    Parses each sheet of an .xlsx file once and serves header detection, column trimming and lookups from memory
+    """
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.excel = pd.ExcelFile(path)
+        self.sheet_names = self.excel.sheet_names
+        self.sheets = {} #  Raw sheets parsed without headers, keyed by sheet name
+        self.lock = threading.Lock() #  The underlying Excel file is not safe to parse from several threads at once
+
+    def raw(self, sheet):
+        """
+        Returns the raw sheet (no header), parsing it only on first access
+        """
+        with self.lock:
+            if sheet not in self.sheets:
+                self.sheets[sheet] = self.excel.parse(sheet, header=None, dtype=object)
+        return self.sheets[sheet]
+
+    def preload(self, sheets, workers):
+        """
+        Parses the given sheets concurrently, spreading them over worker processes
+        """
+        sheets = [sheet for sheet in dict.fromkeys(sheets) if sheet in self.sheet_names and sheet not in self.sheets]
+        workers = min(workers, len(sheets))
+        if workers < 2: return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for parsed in pool.map(parse_sheets, [self.path] * workers, [sheets[i::workers] for i in range(workers)]):
+                self.sheets.update(parsed)
+
+    def header(self, sheet, header=0):
+        """
+        Returns the values of the header row as a list
+        """
+        return self.raw(sheet).iloc[header].values.tolist()
+
+    def read(self, sheet, header=0, last_col=None, usecols=None, nrows=None):
+        """
+        Equivalent to pd.read_excel with the header on the given row, reading up to last_col (inclusive)
+        """
+        raw = self.raw(sheet)
+        cols = self.header(sheet, header)
+        ncols = cols.index(last_col) + 1 if last_col is not None else len(cols) #   Last column to read
+
+        df = raw.iloc[header + 1:, :ncols]
+        if nrows is not None: df = df.iloc[:nrows]
+
+        # Names columns as pandas does: 'Unnamed: i' for empty headers and '.n' suffixes for duplicates
+        names, seen = [], {}
+        for i, col in enumerate(cols[:ncols]):
+            name = f"Unnamed: {i}" if pd.isna(col) else col
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            names.append(name)
+        df = df.set_axis(names, axis=1).reset_index(drop=True).infer_objects()
+
+        if usecols is not None: df = df[usecols]
+
+        return df.copy()
+
+def parse_sheets(path, sheets):
+    """
+    Parses raw sheets of an .xlsx file in a worker process
+    """
+    excel = pd.ExcelFile(path)
+    return {sheet: excel.parse(sheet, header=None, dtype=object) for sheet in sheets}
+
+workbooks = {} #   Workbooks parsed in this session, keyed by file path
+
+def workbook(path):
+    """
+    Returns the parsed workbook of an .xlsx file, parsing it again only if the file was modified
+    """
+    path = os.path.abspath(path)
+    if path not in workbooks or workbooks[path].mtime != os.path.getmtime(path):
+        workbooks[path] = Workbook(path)
+    return workbooks[path]
+
+class ChargingProfile:
+    """
+    Hourly charging profile of a RAMP-mobility results file for a given weather year and time zone, with its time slice labels
+    """
+    def __init__(self, path, year, tz):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+
+        # Imports the charging profiles from the RAMP-mobility results
+        cp = pd.read_csv(path, index_col=0)
+        cp.index = pd.to_datetime(cp.index, utc=True)
+
+        # Converts simulation results time series into the local time zone and resamples into hourly resolution
+        cp = cp.set_index(cp.index.tz_convert(tz))
+        cp = cp[cp.index.year == year]
+        cp = cp.resample('H').mean()
+
+        # Hourly values and their labels in the desired format
+        self.values = cp['Charging Profile'].to_numpy()
+        self.days = np.asarray(cp.index.strftime('D%j'))
+        self.hours = np.array([f'H{h:02d}' for h in range(1, 25)])[cp.index.hour] # Hour labels from H01 to H24
+
+    def normalized(self, how):
+        """
+        Returns the hourly values divided by their sum ('sum') or by the largest datapoint ('max')
+        """
+        norm = {'sum': np.nansum, 'max': np.nanmax}[how](self.values)
+        return (self.values / norm).round(precision)
+
+charging_profiles = {} #  Charging profiles loaded in this session, keyed by (file path, weather year, time zone)
+
+def charging_profile(path, year, tz):
+    """
+    Returns the hourly charging profile of a results file, loading it again only if the file was modified
+    """
+    key = (os.path.abspath(path), year, tz)
+    if key not in charging_profiles or charging_profiles[key].mtime != os.path.getmtime(path):
+        charging_profiles[key] = ChargingProfile(key[0], year, tz)
+    return charging_profiles[key]
+
+schemas = {} #  Empty databases built from a schema file in this session, keyed by file path
+
+def schema_database(path):
+    """
+    Returns an in-memory database holding the tables of a schema file, running the schema again only if the file was modified
+    """
+    path = os.path.abspath(path)
+    if path not in schemas or schemas[path][0] != os.path.getmtime(path):
+        db = sqlite3.connect(':memory:')
+        with open(path, 'r') as f: db.executescript(f.read())
+        schemas[path] = (os.path.getmtime(path), db)
+    return schemas[path][1]
+
 def instantiate_database():
     """
-    Create sqlite database from schema sql file
+    Create sqlite database from schema sql file and open the single connection used by the whole compile
     """
     # Check if database exists or needs to be built
     build_db = not os.path.exists(database)
 
-    # Connect to the new database file
+    if build_in_memory:
+        # Builds the database in memory, starting from a copy of the schema or of the current database, see save_database()
+        conn = sqlite3.connect(':memory:')
+        if build_db or wipe_database: schema_database(schema).backup(conn)
+        else:
+            with contextlib.closing(sqlite3.connect(database)) as disk: disk.backup(conn)
+        if wipe_database and not build_db: print("Database wiped prior to aggregation.\n")
+        for pragma, value in sqlite_pragmas.items(): conn.execute(f"PRAGMA {pragma} = {value}")
+        conn.execute("BEGIN")
+        return conn
+
+    # Connect to the database file and tune it for bulk loading
     conn = sqlite3.connect(database)
-    curs = conn.cursor() # Cursor object interacts with the sqlite db
+    for pragma, value in sqlite_pragmas.items(): conn.execute(f"PRAGMA {pragma} = {value}")
 
-    # Build the database if it doesn't exist. Otherwise clear all data if forced
-    if build_db: curs.executescript(open(schema, 'r').read())
+    # Everything below runs in one transaction that is only committed once the whole compile succeeds
+    # executescript() commits any pending transaction before running, so BEGIN is issued inside the script itself
+    if build_db: conn.executescript("BEGIN;\n" + open(schema, 'r').read())
     elif wipe_database:
-        curs.executescript(open(schema, 'r').read())
-        tables = [t[0] for t in curs.execute("""SELECT name FROM sqlite_master WHERE type='table';""").fetchall()]
-        for table in tables: curs.execute(f"DELETE FROM '{table}'")
+        conn.executescript("BEGIN;\n" + open(schema, 'r').read())
+        tables = [t[0] for t in conn.execute("""SELECT name FROM sqlite_master WHERE type='table';""").fetchall()]
+        for table in tables: conn.execute(f"DELETE FROM '{table}'")
         print("Database wiped prior to aggregation.\n")
-    
-    conn.commit()
-    conn.close()
+    else: conn.execute("BEGIN")
+
+    return conn
+
+def save_database(conn, path=None):
+    """
+    Writes a database built in memory to disk: copies it into a temporary file next to the database, then renames it over the database,
+    so that readers only ever see the previous or the fully compiled database
+    """
+    path = path or database
+    temp = path + '.tmp'
+    if os.path.exists(temp): os.remove(temp)
+    with contextlib.closing(sqlite3.connect(temp)) as disk: conn.backup(disk)
+    os.replace(temp, path)
+
+def to_table(conn, table, df, if_exists='append'):
+    """
+    Writes a dataframe into a table like DataFrame.to_sql, but without committing the open transaction
+    """
+    if if_exists == 'replace':
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.execute(pd.io.sql.get_schema(df, table)) #  SQLite dialect, also when conn is a Recorder
+
+    cols = ', '.join(f'"{col}"' for col in df.columns)
+    conn.executemany(f'INSERT INTO "{table}" ({cols}) VALUES ({", ".join("?" * len(df.columns))})', df.itertuples(index=False, name=None))
+
+class Recorder:
+    """
+    Stands in for the connection of a compile step running in a worker thread, recording its statements
+    so that the single writer applies them to the database in dependency order
+    """
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append(('execute', sql, params))
+
+    def executemany(self, sql, rows):
+        self.statements.append(('executemany', sql, list(rows)))
+
+    def apply(self, conn):
+        for method, sql, params in self.statements: getattr(conn, method)(sql, params)
+
+class TableSchema:
+    """
+    Columns, declared types and primary key of a table of the schema, with the prepared insert statements of the column sets loaded into it
+    """
+    def __init__(self, conn, table):
+        info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        self.table = table
+        self.columns = [col[1] for col in info]
+        self.types = {col[1]: col[2].upper() for col in info}
+        self.primary_key = [col[1] for col in sorted(info, key=lambda col: col[5]) if col[5]]
+        self.statements = {}
+
+    def statement(self, columns):
+        columns = tuple(columns)
+        if columns not in self.statements:
+            self.statements[columns] = f"""REPLACE INTO "{self.table}"({', '.join(columns)}) VALUES({', '.join('?' * len(columns))})"""
+        return self.statements[columns]
+
+    def validate(self, columns, values):
+        """
+        Checks mapped columns against the schema before loading: unknown columns and text that is not a number in numeric columns are errors.
+        Returns a mask of the rows to load, leaving out rows with a missing primary key value
+        """
+        unknown = [col for col in columns if col not in self.types]
+        if unknown: raise ValueError(f"{self.table} has no column(s) {', '.join(unknown)}")
+
+        keep = np.ones(len(values[0]) if values else 0, dtype=bool)
+        for col, column in zip(columns, values):
+            column = pd.Series(column, dtype=object)
+            if self.types[col] in ('INTEGER', 'REAL'):
+                text = column[(column.map(type) == str) & (column != '')] #    Empty strings are blank cells
+                text = text[pd.to_numeric(text, errors='coerce').isna()]
+                if len(text): raise ValueError(f"{self.table}.{col} expects {self.types[col].lower()} values but got {text.unique()[:3].tolist()}")
+            if col in self.primary_key: keep &= ~(column.isna() | (column == '')).to_numpy()
+        return keep
+
+table_schemas = {} #  Table schemas of each schema database, introspected once
+
+def schema_tables():
+    """
+    Returns the schemas of all tables of the schema file, introspecting them on first use.
+    The schema database can only be queried from the thread that created it, so compile_transport() calls this before starting worker threads
+    """
+    db = schema_database(schema)
+    if db not in table_schemas:
+        table_schemas[db] = {t: TableSchema(db, t) for (t,) in db.execute("""SELECT name FROM sqlite_master WHERE type='table'""")}
+    return table_schemas[db]
+
+def table_schema(table):
+    """
+    Returns the columns, types and keys of a table as defined in the schema file
+    """
+    return schema_tables()[table]
+
+def bulk_insert(conn, table, df, columns):
+    """
+    Inserts a dataframe into a table with a single parameterized executemany, reading column arrays rather than rows.
+    columns maps each table column to a column name of df, an array aligned with df, or a constant for every row.
+    The columns are validated against the schema first, see TableSchema.validate()
+    """
+    values = []
+    for source in columns.values():
+        if isinstance(source, str) and source in df.columns: source = df[source]
+        if np.ndim(source) == 0: values.append([source.item() if isinstance(source, np.generic) else source] * len(df))
+        else: values.append(pd.Series(source).tolist()) #   Python scalars, since sqlite3 cannot bind numpy integers
+
+    target = table_schema(table)
+    keep = target.validate(columns, values)
+    rows = zip(*values)
+    if not keep.all():
+        print(f"Skipped {(~keep).sum()} rows of {table} with no {' or '.join(target.primary_key)}")
+        rows = (row for row, k in zip(rows, keep) if k)
+
+    conn.executemany(target.statement(columns), rows)
+
+def dq_columns(df):
+    """
+    Maps the reference and data quality indicator columns shared by most sheets
+    """
+    return {
+        'reference': 'Reference',
+        'data_year': 'Data Year',
+        'dq_rel': 'Reliability',
+        'dq_comp': 'Representativeness',
+        'dq_time': dq_time(df['Data Year']),
+        'dq_geog': 'Geographical',
+        'dq_tech': 'Technological'
+    }
+
+def lifetimes():
+    """
+    Reads technologies' lifetimes from the Lifetime sheet (first entry of each technology)
+    """
+    df = workbook(spreadsheet).read('Lifetime', header=1, usecols=['Technology', 'Lifetime'])
+    return df.drop_duplicates('Technology')
+
+def process_windows(processes):
+    """
+    Active process window index: maps each (tech, vintage) to the periods it is active in, i.e. start <= period < end.
+    Technologies missing from the Lifetime sheet default to 40 years, while a blank lifetime leaves the window open-ended
+    """
+    windows = processes.drop_duplicates().merge(lifetimes(), on='Technology', how='left', indicator=True)
+    life = windows['Lifetime'].where(windows['_merge'] == 'both', 40) #  Default lifetime if not specified
+    windows['start'] = windows['Vintage']
+    windows['end'] = (windows['Vintage'] + life).fillna(np.inf)
+    return windows.set_index(['Technology', 'Vintage'])[['start', 'end']]
+
+def within_lifetime(df):
+    """
+    Joins the rows of a melted vintage x period frame against their process windows and flags those within them
+    """
+    keys = df[['Technology', 'Vintage']]
+    window = keys.join(process_windows(keys), on=['Technology', 'Vintage'])
+    return (window['start'] <= df['Period']) & (df['Period'] < window['end'])
 
 def quinquennial_mapping(vintage):
     """
-    Maps vintages into 5-year periods for aggregation, following this format:
+    Maps vintages (a year or an array of years) into 5-year periods for aggregation, following this format:
     2010 -> 2010
     2011 -> 2015
     2012 -> 2015
@@ -98,33 +447,47 @@ def quinquennial_mapping(vintage):
     #     return base_year + 5
 
     return 5 * -((vintage - 2000) // -5) + 2000 #   Ceiling years to the closest multiple of 5
+
+def aggregate_vintages(df, keys, parameter, aggfunc):
+    """
+    Aggregates vintages into 5-year vintages for each process given by the key columns. Other columns are metadata:
+    the first value of each group is kept, except for notes where the distinct notes of the group are joined
+    """
+    df = df.assign(Vintage=quinquennial_mapping(df['Vintage'].to_numpy(dtype=int)))
+    keys = keys + ['Vintage']
+    metadata = [col for col in df.columns if col not in keys + [parameter]]
+
+    grouped = df.groupby(keys, sort=True)
+    agg = grouped.agg({parameter: aggfunc, **{col: 'first' for col in metadata}})
+    if 'Notes' in metadata:
+        notes = df.drop_duplicates(keys + ['Notes'])
+        notes = notes[notes.duplicated(keys, keep=False) & (notes['Notes'] != '')] #  Only groups with several notes need joining
+        joined = notes.groupby(keys)['Notes'].agg(lambda n: '; '.join(n.astype(str)))
+        agg.loc[joined.index, 'Notes'] = joined
+
+    return agg.reset_index()[df.columns]
     
 def dq_time(data_year):
     """
-    Calculates time appropriateness DQI based on Data Year.
+    Calculates time appropriateness DQI based on Data Year, for a whole column of data years at once.
     """
-    if not isinstance(data_year, (int, float)): # Check if data_year is a number
-        return ""
+    data_year = pd.Series(data_year)
+    years = pd.to_numeric(data_year.mask(data_year.map(type) == str), errors='coerce') #   Non-numeric data years (e.g. empty cells) get no DQI
     
     base_year = datetime.today().year  # Current year
-    diff = abs(base_year - int(data_year))  # Convert to int in case of float and calculate difference
+    diff = (base_year - np.trunc(years)).abs()  # Truncate floats as int() would and calculate difference
 
-    data_quality = {
-        3: 1,
-        6: 2,
-        10: 3,
-        15: 4
-    }
+    thresholds = np.array([3, 6, 10, 15]) #  Years of difference scoring 1, 2, 3 and 4; 5 beyond 15 years
 
-    for key in sorted(data_quality.keys()):  # Iterate through sorted keys to ensure correct order
-        if diff <= key:
-            return data_quality[key]
-    
-    return 5  # Return 5 for greater than 15 years difference
+    # Bins each difference to the first threshold it falls within
+    dqi = np.digitize(diff.fillna(0), thresholds, right=True) + 1
 
-def normalize_to_ascii(text):
+    return pd.Series(dqi, index=data_year.index, dtype=object).where(years.notna(), "")
+
+@functools.lru_cache(maxsize=None)
+def ascii_text(text):
     """
-    Function to normalize text to ASCII
+    Normalizes a string to ASCII (memoized, as the same references repeat across sheets)
     """
     # Normalize to NFKD form which separates characters from their diacritical marks
     normalized = unicodedata.normalize('NFKD', text)
@@ -139,67 +502,67 @@ def normalize_to_ascii(text):
                      .replace('®', '(R)'))
     return ascii_encoded
 
-def cleanup():
+def normalize_to_ascii(values):
     """
-    Removes existing techs of a given vintage with no capacity
+    Normalizes a column of text to ASCII, each distinct string only once. Non-text values are left as is
     """
-    tables = ["ExistingCapacity", "Efficiency", "CostVariable", "CostFixed"] #   Tables to check for tech-vintage pairs with exist_cap = 0
-    
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
+    values = pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    normalized = np.array([ascii_text(u) if isinstance(u, str) else u for u in uniques] + [None], dtype=object) #  Code -1 (missing values) maps to the end
 
-    tech_vintage_remove = curs.execute(f"""SELECT DISTINCT tech, vintage FROM ExistingCapacity WHERE exist_cap < {epsilon}""").fetchall()
-    for table in tables:
-            for tech, vintage in tech_vintage_remove:
-                print(f"Deleted {tech} @ {vintage} in {table} because exist_cap < {epsilon}")
-                curs.execute(f"""DELETE FROM {table} WHERE tech = ? AND vintage = ?""", (tech, vintage))
+    return pd.Series(normalized[codes], index=values.index, dtype=object).where(codes >= 0, values)
 
-    # Get tech-vintage pairs from Efficiency, CostVariable, and CostFixed that do not exist in ExistingCapacity
-    for table in tables[1:]:  # Skip ExistingCapacity
-        tech_vintage_not_in_excap = curs.execute(
-            f"""SELECT DISTINCT tech, vintage FROM {table} WHERE vintage < 2021 
-                AND (tech, vintage) NOT IN (SELECT tech, vintage FROM ExistingCapacity)"""
-        ).fetchall()
-
-        # Remove these pairs from Efficiency, CostVariable, and CostFixed
-        for tech, vintage in tech_vintage_not_in_excap:
-            print(f"Deleted {tech} @ {vintage} in {table} because not in ExistingCapacity")
-            curs.execute(f"""DELETE FROM {table} WHERE tech = ? AND vintage = ?""", (tech, vintage))
-    
+def cleanup(conn):
+    """
+    Removes existing techs of a given vintage with no capacity, and parameters of processes that are not in the model
+    """
+    tables = ["ExistingCapacity", "Efficiency", "CostVariable", "CostFixed"] #   Tables to check for tech-vintage pairs with exist_cap = 0
     tables_with_vintage = ["CostVariable", "CostInvest", "CostFixed", "EmissionActivity"]
     tables_with_period = ["MaxAnnualCapacityFactor", "MinAnnualCapacityFactor"]
     tables_with_tech_only = ["CapacityToActivity", "LifetimeTech"]
 
+    # Temporary (tech, vintage) indexes backing the anti-joins below; dropped once the cleanup is done
+    conn.execute("""CREATE INDEX IF NOT EXISTS cleanup_excap ON ExistingCapacity(tech, vintage)""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS cleanup_efficiency ON Efficiency(tech, vintage)""")
+
+    # Pairs with exist_cap < epsilon are collected first, since they are also removed from ExistingCapacity itself
+    conn.execute("""CREATE TEMP TABLE cleanup_pairs(tech, vintage, PRIMARY KEY (tech, vintage)) WITHOUT ROWID""")
+    conn.execute("""INSERT INTO cleanup_pairs SELECT DISTINCT tech, vintage FROM ExistingCapacity WHERE exist_cap < ?""", (epsilon,))
+
+    deleted = {}
+    def delete(table, reason, condition, *params):
+        count = conn.execute(f"""DELETE FROM {table} AS t WHERE {condition}""", params).rowcount
+        if count: deleted[(table, reason)] = deleted.get((table, reason), 0) + count
+
+    for table in tables:
+        delete(table, f"exist_cap < {epsilon}", """EXISTS (SELECT 1 FROM cleanup_pairs AS c WHERE c.tech = t.tech AND c.vintage = t.vintage)""")
+
+    # Remove tech-vintage pairs from Efficiency, CostVariable, and CostFixed that do not exist in ExistingCapacity
+    for table in tables[1:]:  # Skip ExistingCapacity
+        delete(table, "not in ExistingCapacity", """t.vintage < 2021 
+               AND NOT EXISTS (SELECT 1 FROM ExistingCapacity AS e WHERE e.tech = t.tech AND e.vintage = t.vintage)""")
+
     # Remove tech-vintage pairs from specified tables that do not exist in Efficiency
     for table in tables_with_vintage:
-        tech_vintage_not_in_efficiency = curs.execute(
-            r"""SELECT DISTINCT tech, vintage FROM {} 
-                WHERE tech NOT LIKE '%\_EX' ESCAPE '\' AND (tech, vintage) NOT IN (SELECT tech, vintage FROM Efficiency)""".format(table)
-        ).fetchall()
-
-        for tech, vintage in tech_vintage_not_in_efficiency:
-            print(f"Deleted {tech} @ {vintage} in {table} because not in Efficiency")
-            curs.execute(f"""DELETE FROM {table} WHERE tech = ? AND vintage = ?""", (tech, vintage))
+        delete(table, "not in Efficiency", r"""t.tech NOT LIKE '%\_EX' ESCAPE '\' 
+               AND NOT EXISTS (SELECT 1 FROM Efficiency AS e WHERE e.tech = t.tech AND e.vintage = t.vintage)""")
 
     # Remove tech-period pairs from specified tables that do not exist in Efficiency
     for table in tables_with_period:
-        tech_period_not_in_efficiency = curs.execute(
-            r"""SELECT DISTINCT tech, periods FROM {} 
-                WHERE tech NOT LIKE '%\_EX' ESCAPE '\' AND (tech, periods) NOT IN (SELECT tech, vintage FROM Efficiency)""".format(table)
-        ).fetchall()
-
-        for tech, period in tech_period_not_in_efficiency:
-            print(f"Deleted {tech} @ {period} in {table} because not in Efficiency")
-            curs.execute(f"""DELETE FROM {table} WHERE tech = ? AND periods = ?""", (tech, period))
+        delete(table, "not in Efficiency", r"""t.tech NOT LIKE '%\_EX' ESCAPE '\' 
+               AND NOT EXISTS (SELECT 1 FROM Efficiency AS e WHERE e.tech = t.tech AND e.vintage = t.periods)""")
 
     # Remove tech-only entries from specified tables that do not exist in Efficiency
     for table in tables_with_tech_only:
-        for tech in tech_vintage_not_in_efficiency:
-            print(f"Deleted {tech} in {table} because not in Efficiency")
-            curs.execute(f"""DELETE FROM {table} WHERE tech = ?""", (tech,))
+        delete(table, "not in Efficiency", r"""t.tech NOT LIKE '%\_EX' ESCAPE '\' 
+               AND NOT EXISTS (SELECT 1 FROM Efficiency AS e WHERE e.tech = t.tech)""")
 
-    conn.commit()
-    conn.close()
+    conn.execute("""DROP TABLE cleanup_pairs""")
+    conn.execute("""DROP INDEX cleanup_excap""")
+    conn.execute("""DROP INDEX cleanup_efficiency""")
+
+    for (table, reason), count in deleted.items():
+        print(f"Deleted {count} rows in {table} because {reason}")
 
     print(f"Cleanup complete.\n")
 
@@ -209,12 +572,8 @@ def cleanup():
 ##################################################
 """
 
-def insert_template():
-    """ 
-    Imports predefined template tables into the sqlite database
-    """
-
-    tables = [
+# Template tables imported as they are into the database
+template_tables = [
     "commodity_labels", #   CommodityType
     "currencies", # 
     "dq_estimate",
@@ -232,47 +591,41 @@ def insert_template():
     "time_of_day", #        TimeofDay
     "tech_annual", #        Includes those technologies with constant annual demand [deprecated list]
     "StorageDuration" #     Assumes 8760 hours of storage for H2 to simulate unlimited supply year-round
-    ]
+]
 
-    # Read the specified sheets into a dictionary of dataframes
-    dfs = pd.read_excel(template, sheet_name=tables)
+def insert_template(conn):
+    """ 
+    Imports predefined template tables into the sqlite database
+    """
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
+    # Read the specified sheets into a dictionary of dataframes
+    wb = workbook(template)
+    dfs = {table: wb.read(table) for table in template_tables}
 
     # For each table, insert the data from the corresponding dataframe
     for sheet_name, df in dfs.items():
         # Convert NaNs to None to handle SQL nulls properly
         df_clean = df.where(pd.notnull(df), None)
-        df_clean.to_sql(sheet_name, conn, if_exists='replace', index=False)
-            
-    conn.commit()
-    conn.close()
+        to_table(conn, sheet_name, df_clean, if_exists='replace')
 
     print(f"Template tables inserted into {os.path.basename(database)}\n")
 
-def compile_ref():
+def compile_ref(conn):
     """
     Reads references from the .xlsx file and compiles them into .sqlite format 
     """
     sheet = 'References'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
     # Imports the table on the excel sheet and normalizes references to ASCII
-    df = pd.read_excel(spreadsheet, sheet_name = sheet)
-    df['References'] = df['References'].apply(normalize_to_ascii)
+    df = wb.read(sheet)
+    df['References'] = normalize_to_ascii(df['References'])
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO "references"(reference) VALUES (?)""", (f"[Transport] {row['References']}",)) # value is treated as a single tuple containing one element by adding a comma inside the tuple
-            
-    conn.commit()
-    conn.close()
+    # Replace parameters in the database
+    bulk_insert(conn, 'references', df, {'reference': "[Transport] " + df['References'].astype(str)})
 
     print(f"References compiled into {os.path.basename(database)}\n")
 
@@ -282,69 +635,59 @@ def compile_ref():
 ##################################################
 """
 
-def compile_techs():
+def compile_techs(conn):
     """
     Reads technologies from the .xlsx file and compiles them into .sqlite format 
     """
     sheet = 'Techs'
     last_col = 'Category'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to read
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, usecols=range(ncols + 1))
+    df = wb.read(sheet, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
     df = df.fillna('')
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute(f"""REPLACE INTO technologies(tech, flag, sector, tech_desc, tech_category, additional_notes)
-                    VALUES('{row['Technology']}', '{row['Flag']}', 'Transport', '{row['Description']}', '{row['Category']}', '{row['Details']}')""")
-            
-    conn.commit()
-    conn.close()
+    # Replace parameters in the database
+    bulk_insert(conn, 'technologies', df.astype(str), {
+        'tech': 'Technology',
+        'flag': 'Flag',
+        'sector': 'Transport',
+        'tech_desc': 'Description',
+        'tech_category': 'Category',
+        'additional_notes': 'Details'
+    })
 
     print(f"Technology data compiled into {os.path.basename(database)}\n")
 
-def compile_comms():
+def compile_comms(conn):
     """
     Reads commodities from the .xlsx file and compiles them into .sqlite format 
     """
     sheet = 'Comms'
     last_col = 'Details'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, usecols=range(ncols + 1))
+    df = wb.read(sheet, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
     df = df.fillna('')
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute(f"""REPLACE INTO commodities(comm_name, flag, comm_desc, additional_notes)
-                    VALUES('{row['Commodity']}', '{row['Flag']}', '{row['Description']}', '{row['Details']}')""")
-            
-    conn.commit()
-    conn.close()
+    # Replace parameters in the database
+    bulk_insert(conn, 'commodities', df.astype(str), {
+        'comm_name': 'Commodity',
+        'flag': 'Flag',
+        'comm_desc': 'Description',
+        'additional_notes': 'Details'
+    })
 
     print(f"Commodity data compiled into {os.path.basename(database)}\n")
 
@@ -354,7 +697,7 @@ def compile_comms():
 ##################################################
 """
 
-def compile_demand():
+def compile_demand(conn):
     """
     Reads demands from the .xlsx file and compiles them into .sqlite format 
     """
@@ -362,15 +705,12 @@ def compile_demand():
     parameter = 'Demand'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -385,20 +725,18 @@ def compile_demand():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO Demand(regions, periods, demand_comm, demand, demand_units, demand_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (province, row['Period'], row['Demand Commodity'], row[parameter], row['Unit'], row['Notes'], 
-                    row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'Demand', df, {
+        'regions': province,
+        'periods': 'Period',
+        'demand_comm': 'Demand Commodity',
+        'demand': parameter,
+        'demand_units': 'Unit',
+        'demand_notes': 'Notes',
+        **dq_columns(df)
+    })
 
     print(f"Demand data compiled into {os.path.basename(database)}\n")
 
@@ -408,7 +746,7 @@ def compile_demand():
 #########################################################
 """
 
-def compile_dsd():
+def compile_dsd(conn):
     """
     Reads charging demand distribution from RAMP-mobility simulation results and compiles them into the .sqlite format 
     """
@@ -416,76 +754,42 @@ def compile_dsd():
     last_col = 'Technological'
     n_demands = 3
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the metadata on the excel sheet
-    metadata = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1), nrows=n_demands) # Number of demands that are affected by the dsd
-
-    # Imports the template format of the DSD table
-    dsd_template = pd.read_excel(template, sheet_name = 'DemandSpecificDistribution', header=None, nrows=1).iloc[0].values.tolist()
-
-    # Imports the charging profiles from the RAMP-mobility results
-    cp = pd.read_csv(ldv_profile, index_col=0)
-    cp.index = pd.to_datetime(cp.index, utc=True)
-    
-    # Converts simulation results time series into ET time zone, resamples into hourly resolution, and normalizes distribution
-    cp = cp.set_index(cp.index.tz_convert('America/Toronto'))
-    cp = cp[cp.index.year == weather_year]
-    cp = cp.resample('H').mean()
-    cp = cp/cp.sum()
-
-    # Labels time series into the desired format
-    cp['Day'] = cp.index.strftime('D%j')
-    # cp['Hour'] = cp.index.strftime('H%H')
-
-    cp.reset_index(inplace=True)
-    cp.rename(columns={'index': 'Timestamp'}, inplace=True)
-    cp['Hour'] = (cp['Timestamp'].dt.hour + 1).astype(str).str.zfill(2).apply(lambda x: f'H{x}') # Hour labels from H01 to H24
-    cp.set_index('Timestamp', inplace=True)    
-    
-    # Creates DSD dataframe from the template and fills in the DSD from the RAMP-mobility results along with the metadata from the spreadsheet database
-    df = pd.DataFrame(columns=dsd_template)
-    df['dsd'] = cp['Charging Profile'].round(precision).values # DSDs rounded to 10 decimals
-    df['season_name'] = cp['Day'].values
-    df['time_of_day_name'] = cp['Hour'].values
-
-    df['demand_name'] = metadata['Target Demand'].values[0]
-    df['regions'] = metadata['Region'].values[0]
-    df.loc[df['time_of_day_name'] == 'H01', 'dsd_notes'] = metadata['Notes'].values[0] #    Only shown every 24th hour to reduce database size
-    df.loc[df['time_of_day_name'] == 'H01', 'reference'] = metadata['Reference'].apply(normalize_to_ascii).values[0] #    Only shown every 24th hour to reduce database size
-    df['data_year'] = metadata['Data Year'].astype(int).values[0]
-    df['dq_rel'] = metadata['Reliability'].astype(int).values[0]
-    df['dq_comp'] = metadata['Representativeness'].astype(int).values[0]
-    df['dq_time'] = metadata['Temporal'].astype(int).values[0]
-    df['dq_geog'] = metadata['Geographical'].astype(int).values[0]
-    df['dq_tech'] = metadata['Technological'].astype(int).values[0]
-
-    # Inserts the remaining affected demands into the dataframe
-    df_merge = pd.DataFrame(columns=dsd_template)
-
-    for i in range(1, n_demands):
-        df2 = df.copy()
-        df2['demand_name'] = metadata['Target Demand'].values[i]
-        df_merge = pd.concat([df_merge, df2], axis=0)
-
-    df_merged = pd.concat([df, df_merge], axis=0)
-
-    # Convert NaNs to None to handle SQL nulls properly
-    df_merged = df_merged.where(pd.notnull(df_merged), None)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-
-    # Insert the dataframe into the sqlite database
-    df_merged.to_sql('DemandSpecificDistribution', conn, if_exists='replace', index=False)
-            
-    conn.commit()
-    conn.close()
+    metadata = wb.read(sheet, header=1, last_col=last_col, nrows=n_demands) # Number of demands that are affected by the dsd
+    metadata = metadata.astype(object).where(metadata.notna(), None) #    SQL nulls for empty cells
+
+    # Imports the hourly charging profiles from the RAMP-mobility results and normalizes distribution
+    cp = charging_profile(ldv_profile, weather_year, time_zone)
+
+    # One distribution per time slice: the hour repeated when clocks fall back is summed into its slice, keeping the distribution summing to one
+    slices = pd.Series(cp.normalized('sum')).groupby([cp.days, cp.hours], sort=False).sum()
+    days, hours = (slices.index.get_level_values(i).to_numpy() for i in range(2))
+    n_slices, n_rows = len(slices), len(metadata)
+
+    # Broadcasts the distribution across the affected demands (one per row of the sheet), each with its own region and metadata
+    first_hour = np.tile(hours == 'H01', n_rows) #    Notes and references only shown every 24th hour to reduce database size
+    per_row = lambda values: np.repeat(np.asarray(values, dtype=object), n_slices)
+
+    # Insert the distributions into the sqlite database
+    bulk_insert(conn, 'DemandSpecificDistribution', pd.DataFrame(index=range(n_slices * n_rows)), {
+        'regions': per_row(metadata['Region']),
+        'season_name': np.tile(days, n_rows),
+        'time_of_day_name': np.tile(hours, n_rows),
+        'demand_name': per_row(metadata['Target Demand']),
+        'dsd': np.tile(slices.round(precision).to_numpy(), n_rows), # DSDs rounded to the model precision
+        'dsd_notes': np.where(first_hour, per_row(metadata['Notes']), None),
+        'reference': np.where(first_hour, per_row(normalize_to_ascii(metadata['Reference'])), None),
+        'data_year': per_row(metadata['Data Year'].astype(int)),
+        'dq_rel': per_row(metadata['Reliability'].astype(int)),
+        'dq_comp': per_row(metadata['Representativeness'].astype(int)),
+        'dq_time': per_row(metadata['Temporal'].astype(int)),
+        'dq_geog': per_row(metadata['Geographical'].astype(int)),
+        'dq_tech': per_row(metadata['Technological'].astype(int)),
+    })
 
     print(f"Demand specific distributions compiled into {os.path.basename(database)}\n")
 
@@ -495,73 +799,44 @@ def compile_dsd():
 ##################################################
 """
 
-def compile_cft():
+def compile_cft(conn):
     """
     Reads charging demand distribution from RAMP-mobility simulation results and compiles them into the .sqlite format 
     """
     sheet = 'DemandDist'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the metadata on the excel sheet
-    metadata = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1), nrows=1)
-    
-    # Imports the template format of the CFT table
-    cft_template = pd.read_excel(template, sheet_name = 'CapacityFactorTech', header=None, nrows=1).iloc[0].values.tolist()
-
-    # Imports the charging profiles from the RAMP-mobility results
-    cp = pd.read_csv(ldv_profile, index_col=0)
-    cp.index = pd.to_datetime(cp.index, utc=True)
+    metadata = wb.read(sheet, header=1, last_col=last_col, nrows=1)
     
-    # Converts simulation results time series into ET time zone, resamples into hourly resolution, and normalizes distribution
-    cp = cp.set_index(cp.index.tz_convert('America/Toronto'))
-    cp = cp[cp.index.year == weather_year]
-    cp = cp.resample('H').mean()
-    cp = cp/cp.max()                # normalize by the largest datapoint since the charging distribution will go to capacity factor tech
-
-    # Labels time series into the desired format
-    cp['Day'] = cp.index.strftime('D%j')
-    # cp['Hour'] = cp.index.strftime('H%H')
-
-    cp.reset_index(inplace=True)
-    cp.rename(columns={'index': 'Timestamp'}, inplace=True)
-    cp['Hour'] = (cp['Timestamp'].dt.hour + 1).astype(str).str.zfill(2).apply(lambda x: f'H{x}') # Hour labels from H01 to H24
-    cp.set_index('Timestamp', inplace=True)    
-    
-    # Creates the charging dist dataframe from the template and fills in the charging dist from the RAMP-mobility results along with the metadata from the spreadsheet database
-    df = pd.DataFrame(columns=cft_template)
-    df['cf_tech'] = cp['Charging Profile'].round(precision).values # the charging dists rounded to 10 decimals
-    df['season_name'] = cp['Day'].values
-    df['time_of_day_name'] = cp['Hour'].values
-
-    df['tech'] = metadata['Technology'].values[0]
-    df['regions'] = province
-    df.loc[df['time_of_day_name'] == 'H01', 'cf_tech_notes'] = metadata['Notes'].values[0] #    Only shown every 24th hour to reduce database size
-    df.loc[df['time_of_day_name'] == 'H01', 'reference'] = metadata['Reference'].apply(normalize_to_ascii).values[0] #    Only shown every 24th hour to reduce database size
-    df['data_year'] = metadata['Data Year'].astype(int).values[0]
-    df['dq_rel'] = metadata['Reliability'].astype(int).values[0]
-    df['dq_comp'] = metadata['Representativeness'].astype(int).values[0]
-    df['dq_time'] = metadata['Temporal'].astype(int).values[0]
-    df['dq_geog'] = metadata['Geographical'].astype(int).values[0]
-    df['dq_tech'] = metadata['Technological'].astype(int).values[0]
-
-    # Convert NaNs to None to handle SQL nulls properly
-    df = df.where(pd.notnull(df), None)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-
-    # Insert the dataframe into the sqlite database
-    df.to_sql('CapacityFactorTech', conn, if_exists='replace', index=False)
-            
-    conn.commit()
-    conn.close()
+    # Imports the hourly charging profiles from the RAMP-mobility results
+    cp = charging_profile(ldv_profile, weather_year, time_zone)
+
+    # One capacity factor per time slice: the hour repeated when clocks fall back keeps the larger of its two values
+    slices = pd.Series(cp.normalized('max')).groupby([cp.days, cp.hours], sort=False).max() # normalize by the largest datapoint since the charging distribution will go to capacity factor tech
+    days, hours = (slices.index.get_level_values(i).to_numpy() for i in range(2))
+    first_hour = hours == 'H01' #    Notes and references only shown every 24th hour to reduce database size
+
+    # Insert the capacity factors into the sqlite database
+    bulk_insert(conn, 'CapacityFactorTech', pd.DataFrame(index=range(len(slices))), {
+        'regions': province,
+        'season_name': days,
+        'time_of_day_name': hours,
+        'tech': metadata['Technology'].values[0],
+        'cf_tech': slices.to_numpy(),
+        'cf_tech_notes': np.where(first_hour, metadata['Notes'].values[0], None),
+        'reference': np.where(first_hour, normalize_to_ascii(metadata['Reference']).values[0], None),
+        'data_year': metadata['Data Year'].astype(int).values[0],
+        'dq_rel': metadata['Reliability'].astype(int).values[0],
+        'dq_comp': metadata['Representativeness'].astype(int).values[0],
+        'dq_time': metadata['Temporal'].astype(int).values[0],
+        'dq_geog': metadata['Geographical'].astype(int).values[0],
+        'dq_tech': metadata['Technological'].astype(int).values[0],
+    })
 
     print(f"Capacity factor distributions compiled into {os.path.basename(database)}\n")
 
@@ -571,39 +846,32 @@ def compile_cft():
 ##################################################
 """
 
-def compile_lifetime():
+def compile_lifetime(conn):
     """
     Reads lifetimes from the .xlsx file and compiles them into .sqlite format 
     """
     sheet = 'Lifetime'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet and normalize references to ASCII
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
     df = df.fillna('')
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
 
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO LifetimeTech(regions, tech, life, life_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (province, row['Technology'], row['Lifetime'], row['Notes'], 
-                    row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-
-    conn.commit()
-    conn.close()
+    # Replace parameters in the database
+    bulk_insert(conn, 'LifetimeTech', df, {
+        'regions': province,
+        'tech': 'Technology',
+        'life': 'Lifetime',
+        'life_notes': 'Notes',
+        **dq_columns(df)
+    })
 
     print(f"Lifetime data compiled into {os.path.basename(database)}\n")
 
@@ -613,7 +881,7 @@ def compile_lifetime():
 ##################################################
 """
 
-def compile_excap():
+def compile_excap(conn):
     """
     Reads existing capacities from the .xlsx file and compiles them into .sqlite format 
     """
@@ -621,15 +889,12 @@ def compile_excap():
     parameter = 'ExistingCapacity'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -644,27 +909,22 @@ def compile_excap():
 
     if aggregate_excap:
         # Aggregates 2000-2020 vintages into 5-year vintages (e.g., 2002 -> 2000 and 2003 -> 2005)
-        df.Vintage = df.Vintage.astype(int)
-        df['qVintage'] = df.Vintage.apply(quinquennial_mapping)
-        df = df.groupby([i for i in df.columns.tolist() if i not in ['Vintage', parameter]]).agg({parameter: 'sum'}).reset_index()
-        df = df.rename(columns={'qVintage': 'Vintage'})
+        df = aggregate_vintages(df, ['Technology'], parameter, 'sum')
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO ExistingCapacity(regions, tech, vintage, exist_cap, exist_cap_units, exist_cap_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Technology'], row['Vintage'], row[parameter], row['Unit'], row['Notes'], 
-                row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'ExistingCapacity', df, {
+        'regions': province,
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'exist_cap': parameter,
+        'exist_cap_units': 'Unit',
+        'exist_cap_notes': 'Notes',
+        **dq_columns(df)
+    })
 
     print(f"Existing capacity data compiled into {os.path.basename(database)}\n")
 
@@ -674,37 +934,30 @@ def compile_excap():
 ##################################################
 """
 
-def compile_c2a():
+def compile_c2a(conn):
     """
     Reads c2a factors from the .xlsx file and compiles them into .sqlite format 
     """
     sheet = 'Cap2Act'
     last_col = 'Notes'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
     df = df.fillna('')
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO CapacityToActivity(regions, tech, c2a, c2a_notes)
-                        VALUES(?, ?, ?, ?)""",
-                    (province, row['Technology'], row['Capacity to Activity'], f"[{row['Activity Unit']}/{row['Capacity Unit']}] {row['Notes']}"))
-
-    conn.commit()
-    conn.close()
+    # Replace parameters in the database
+    bulk_insert(conn, 'CapacityToActivity', df, {
+        'regions': province,
+        'tech': 'Technology',
+        'c2a': 'Capacity to Activity',
+        'c2a_notes': "[" + df['Activity Unit'].astype(str) + "/" + df['Capacity Unit'].astype(str) + "] " + df['Notes'].astype(str)
+    })
 
     print(f"C2A factors data compiled into {os.path.basename(database)}\n")
 
@@ -714,7 +967,7 @@ def compile_c2a():
 ##################################################
 """
 
-def compile_acf():
+def compile_acf(conn):
     """
     Reads annual cap factors from the .xlsx file and compiles them into .sqlite format 
     """
@@ -722,15 +975,12 @@ def compile_acf():
     parameter = 'MaxAnnualCapFactor'
     last_col = 'Notes'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -746,43 +996,39 @@ def compile_acf():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
+    df['Reference'] = normalize_to_ascii(df['Reference'])
 
-     # Reads technologies' lifetimes and last period of exsiting technologies
-    df_lifetime = pd.read_excel(spreadsheet, sheet_name = 'Lifetime', skiprows=[0], usecols=['Technology', 'Lifetime'])
-    period_0 = pd.read_excel(template, sheet_name='time_periods')
+    # Reads the last period of existing technologies
+    period_0 = workbook(template).read('time_periods')
     period_0 = period_0[period_0['flag'] == 'e'].max().values[0]
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-    
-    for _idx, row in df.iterrows():
-
-        if row['Technology'].endswith('_EX'): #  Applies only for residual technologies
-            
-            # Attempt to find the lifetime for the given technology
-            lifetime_rows = df_lifetime[df_lifetime.Technology == row['Technology']].Lifetime
-            if len(lifetime_rows) > 0:
-                lifetime = lifetime_rows.values[0]
-            else:
-                lifetime = 40  # Default lifetime if not specified
-            
-            if period_0 + lifetime <= row['Period']: continue # Checks for capacity factors outside existing technologies' lifetimes
-
-        curs.execute("""REPLACE INTO MaxAnnualCapacityFactor(regions, periods, tech, output_comm, max_acf, max_acf_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Period'], row['Technology'], row['Output Commodity'], row[parameter], row['Notes'], 
-                row['Reference'], row['Data Year'], 1, 1, dq_time(row['Data Year']), 1, 1))
-        
-        if not 'CHRG' in row['Technology']:
-            curs.execute("""REPLACE INTO MinAnnualCapacityFactor(regions, periods, tech, output_comm, min_acf, min_acf_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                    VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (province, row['Period'], row['Technology'], row['Output Commodity'], row[parameter]*0.999, f"99.9% of MaxAnnualCapacityFactor for computational slack. {row['Notes']}", 
-                    row['Reference'], row['Data Year'], 1, 1, dq_time(row['Data Year']), 1, 1))
-            
-    conn.commit()
-    conn.close()
+    # Checks for capacity factors outside existing technologies' lifetimes; applies only for residual technologies, taken as vintage period_0
+    residual = df['Technology'].str.endswith('_EX')
+    df = df[~residual | within_lifetime(df.assign(Vintage=period_0))]
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'MaxAnnualCapacityFactor', df, {
+        'regions': province,
+        'periods': 'Period',
+        'tech': 'Technology',
+        'output_comm': 'Output Commodity',
+        'max_acf': parameter,
+        'max_acf_notes': 'Notes',
+        **dq_columns(df),
+        'dq_rel': 1, 'dq_comp': 1, 'dq_geog': 1, 'dq_tech': 1
+    })
+
+    df = df[~df['Technology'].str.contains('CHRG', regex=False)]
+    bulk_insert(conn, 'MinAnnualCapacityFactor', df, {
+        'regions': province,
+        'periods': 'Period',
+        'tech': 'Technology',
+        'output_comm': 'Output Commodity',
+        'min_acf': df[parameter]*0.999,
+        'min_acf_notes': "99.9% of MaxAnnualCapacityFactor for computational slack. " + df['Notes'].astype(str),
+        **dq_columns(df),
+        'dq_rel': 1, 'dq_comp': 1, 'dq_geog': 1, 'dq_tech': 1
+    })
 
     print(f"Max/min annual cap factors data compiled into {os.path.basename(database)}\n")
 
@@ -792,7 +1038,7 @@ def compile_acf():
 ##################################################
 """
 
-def compile_efficiency():
+def compile_efficiency(conn):
     """
     Reads efficiencies from the .xlsx file and compiles them into .sqlite format 
     """
@@ -800,15 +1046,12 @@ def compile_efficiency():
     parameter = 'Efficiency'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -826,27 +1069,24 @@ def compile_efficiency():
         df.Vintage = df.Vintage.astype(int)
         df_ex = df[df.Vintage <= 2020]
         df_new = df[df.Vintage > 2020]
-        df_ex['qVintage'] = df_ex.Vintage.apply(quinquennial_mapping)
-        df_ex_agg = df_ex.groupby([i for i in df_ex.columns.tolist() if i not in ['Vintage', parameter]]).agg({parameter: 'min'}).reset_index() # 'min' helps decrease overestimated energy use
-        df_ex_agg = df_ex_agg.rename(columns={'qVintage': 'Vintage'})
+        df_ex_agg = aggregate_vintages(df_ex, ['Input Commodity', 'Technology', 'Output Commodity'], parameter, 'min') # 'min' helps decrease overestimated energy use
         df = pd.concat([df_ex_agg, df_new], ignore_index=True).reset_index(drop=True)
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO Efficiency(regions, input_comm, tech, vintage, output_comm, efficiency, eff_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Input Commodity'], row['Technology'], row['Vintage'], row['Output Commodity'], row[parameter], f"[{row['Unit']}] {row['Notes']}", 
-                row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'Efficiency', df, {
+        'regions': province,
+        'input_comm': 'Input Commodity',
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'output_comm': 'Output Commodity',
+        'efficiency': parameter,
+        'eff_notes': "[" + df['Unit'].astype(str) + "] " + df['Notes'].astype(str),
+        **dq_columns(df)
+    })
 
     print(f"Efficiency data compiled into {os.path.basename(database)}\n")
 
@@ -856,7 +1096,7 @@ def compile_efficiency():
 ##################################################
 """
 
-def compile_costinvest():
+def compile_costinvest(conn):
     """
     Reads investment costs from the .xlsx file and compiles them into .sqlite format 
     """
@@ -864,15 +1104,12 @@ def compile_costinvest():
     parameter = 'CostInvest'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -887,22 +1124,21 @@ def compile_costinvest():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO CostInvest(regions, tech, vintage, cost_invest, cost_invest_units, cost_invest_notes, data_cost_invest, data_cost_year, data_curr,
-                     reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Technology'], row['Vintage'], row[parameter], f"{int(row['Currency Year'])} {row['Currency']} ({row['Unit']})", row['Notes'], 
-                 round(row[parameter]/row['Conversion Factor'], precision), row['Original Currency Year'], row['Original Currency'],
-                row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'CostInvest', df, {
+        'regions': province,
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'cost_invest': parameter,
+        'cost_invest_units': df['Currency Year'].astype(int).astype(str) + " " + df['Currency'].astype(str) + " (" + df['Unit'].astype(str) + ")",
+        'cost_invest_notes': 'Notes',
+        'data_cost_invest': [round(x, precision) for x in (df[parameter]/df['Conversion Factor']).tolist()], #  Python rounding of the converted values, as numpy's may differ in the last digit
+        'data_cost_year': 'Original Currency Year',
+        'data_curr': 'Original Currency',
+        **dq_columns(df)
+    })
 
     print(f"Investment cost data compiled into {os.path.basename(database)}\n")
 
@@ -912,7 +1148,7 @@ def compile_costinvest():
 ##################################################
 """
 
-def compile_costvariable():
+def compile_costvariable(conn):
     """
     Reads variable costs from the .xlsx file and compiles them into .sqlite format 
     """
@@ -920,15 +1156,12 @@ def compile_costvariable():
     parameter = 'CostVariable'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -944,35 +1177,25 @@ def compile_costvariable():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Reads technologies' lifetimes
-    df_lifetime = pd.read_excel(spreadsheet, sheet_name = 'Lifetime', skiprows=[0], usecols=['Technology', 'Lifetime'])
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-    
-    for _idx, row in df.iterrows():
-
-        # Attempt to find the lifetime for the given technology
-        lifetime_rows = df_lifetime[df_lifetime.Technology == row['Technology']].Lifetime
-        if len(lifetime_rows) > 0:
-            lifetime = lifetime_rows.values[0]
-        else:
-            lifetime = 40  # Default lifetime if not specified
-
-        if row['Period'] < row['Vintage'] or row['Vintage'] + lifetime <= row['Period']: continue # Checks for var costs outside the expected technology's lifetime
-
-        curs.execute("""REPLACE INTO CostVariable(regions, periods, tech, vintage, cost_variable, cost_variable_units, cost_variable_notes, data_cost_variable, data_cost_year, data_curr,
-                     reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Period'], row['Technology'], row['Vintage'], row[parameter], f"{int(row['Currency Year'])} {row['Currency']} ({row['Unit']})", row['Notes'], 
-                 round(row[parameter]/row['Conversion Factor'], precision), row['Original Currency Year'], row['Original Currency'],
-                row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Checks for var costs outside the expected technology's lifetime
+    df = df[within_lifetime(df)]
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'CostVariable', df, {
+        'regions': province,
+        'periods': 'Period',
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'cost_variable': parameter,
+        'cost_variable_units': df['Currency Year'].astype(int).astype(str) + " " + df['Currency'].astype(str) + " (" + df['Unit'].astype(str) + ")",
+        'cost_variable_notes': 'Notes',
+        'data_cost_variable': [round(x, precision) for x in (df[parameter]/df['Conversion Factor']).tolist()], #  Python rounding of the converted values, as numpy's may differ in the last digit
+        'data_cost_year': 'Original Currency Year',
+        'data_curr': 'Original Currency',
+        **dq_columns(df)
+    })
 
     print(f"Variable cost data compiled into {os.path.basename(database)}\n")
 
@@ -982,7 +1205,7 @@ def compile_costvariable():
 ##################################################
 """
 
-def compile_costfixed():
+def compile_costfixed(conn):
     """
     Reads fixed costs from the .xlsx file and compiles them into .sqlite format 
     """
@@ -990,15 +1213,12 @@ def compile_costfixed():
     parameter = 'CostFixed'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -1014,35 +1234,25 @@ def compile_costfixed():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Reads technologies' lifetimes
-    df_lifetime = pd.read_excel(spreadsheet, sheet_name = 'Lifetime', skiprows=[0], usecols=['Technology', 'Lifetime'])
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-    
-    for _idx, row in df.iterrows():
-        
-        # Attempt to find the lifetime for the given technology
-        lifetime_rows = df_lifetime[df_lifetime.Technology == row['Technology']].Lifetime
-        if len(lifetime_rows) > 0:
-            lifetime = lifetime_rows.values[0]
-        else:
-            lifetime = 40  # Default lifetime if not specified
-            
-        if row['Period'] < row['Vintage'] or row['Vintage'] + lifetime <= row['Period']: continue # Checks for fixed costs outside the expected technology's lifetime
-
-        curs.execute("""REPLACE INTO CostFixed(regions, periods, tech, vintage, cost_fixed, cost_fixed_units, cost_fixed_notes, data_cost_fixed, data_cost_year, data_curr,
-                     reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Period'], row['Technology'], row['Vintage'], row[parameter], f"{int(row['Currency Year'])} {row['Currency']} ({row['Unit']})", row['Notes'], 
-                 round(row[parameter]/row['Conversion Factor'], precision), row['Original Currency Year'], row['Original Currency'],
-                row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Checks for fixed costs outside the expected technology's lifetime
+    df = df[within_lifetime(df)]
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'CostFixed', df, {
+        'regions': province,
+        'periods': 'Period',
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'cost_fixed': parameter,
+        'cost_fixed_units': df['Currency Year'].astype(int).astype(str) + " " + df['Currency'].astype(str) + " (" + df['Unit'].astype(str) + ")",
+        'cost_fixed_notes': 'Notes',
+        'data_cost_fixed': [round(x, precision) for x in (df[parameter]/df['Conversion Factor']).tolist()], #  Python rounding of the converted values, as numpy's may differ in the last digit
+        'data_cost_year': 'Original Currency Year',
+        'data_curr': 'Original Currency',
+        **dq_columns(df)
+    })
 
     print(f"Fixed cost data compiled into {os.path.basename(database)}\n")
 
@@ -1052,7 +1262,7 @@ def compile_costfixed():
 ##################################################
 """
 
-def compile_emissionact():
+def compile_emissionact(conn):
     """
     Reads emission factors from activities from the .xlsx file and compiles them into .sqlite format 
     """
@@ -1060,15 +1270,12 @@ def compile_emissionact():
     parameter = 'EmissionActivity'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -1083,29 +1290,24 @@ def compile_emissionact():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        if row['Emission Commodity'] in ['ch4', 'n2o'] and convert_emission_units:
-            curs.execute("""REPLACE INTO EmissionActivity(regions, emis_comm, input_comm, tech, vintage, output_comm, emis_act, emis_act_units, emis_act_notes, 
-                        reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                        (province, row['Emission Commodity'], row['Input Commodity'], row['Technology'], row['Vintage'], row['Output Commodity'], row[parameter]*1000, row['Unit'].replace('kt', 't'), row['Notes'], 
-                        row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-        
-        else:
-            curs.execute("""REPLACE INTO EmissionActivity(regions, emis_comm, input_comm, tech, vintage, output_comm, emis_act, emis_act_units, emis_act_notes, 
-                        reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                        (province, row['Emission Commodity'], row['Input Commodity'], row['Technology'], row['Vintage'], row['Output Commodity'], row[parameter], row['Unit'], row['Notes'], 
-                        row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Converts CH4 and N2O from kt to t
+    convert = df['Emission Commodity'].isin(['ch4', 'n2o']) & convert_emission_units
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'EmissionActivity', df, {
+        'regions': province,
+        'emis_comm': 'Emission Commodity',
+        'input_comm': 'Input Commodity',
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'output_comm': 'Output Commodity',
+        'emis_act': df[parameter].where(~convert, df[parameter]*1000),
+        'emis_act_units': df['Unit'].where(~convert, df['Unit'].astype(str).str.replace('kt', 't')),
+        'emis_act_notes': 'Notes',
+        **dq_columns(df)
+    })
 
     print(f"Emission factors from activity data compiled into {os.path.basename(database)}\n")
 
@@ -1115,7 +1317,7 @@ def compile_emissionact():
 ##################################################
 """
 
-def compile_emissionemb():
+def compile_emissionemb(conn):
     """
     Reads emission factors from capacities from the .xlsx file and compiles them into .sqlite format 
     """
@@ -1123,15 +1325,12 @@ def compile_emissionemb():
     parameter = 'EmissionEmbodied'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -1149,11 +1348,10 @@ def compile_emissionemb():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
+    df['Reference'] = normalize_to_ascii(df['Reference'])
 
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
+    # Converts CH4 and N2O from kt to t
+    convert = df['Emission Commodity'].isin(['ch4', 'n2o']) & convert_emission_units
 
     # Creates the EmissionEmbodied table
     # curs.execute("""CREATE TABLE EmissionEmbodied(
@@ -1169,23 +1367,17 @@ def compile_emissionemb():
     #                 notes       TEXT, reference, data_year, data_flags, dq_est, dq_rel, dq_comp, dq_time, dq_geog, dq_tech, additional_notes,
     #                 PRIMARY KEY (regions, emis_comm, tech, vintage))""")
 
-    for _idx, row in df.iterrows():
-        if row['Emission Commodity'] in ['ch4', 'n2o'] and convert_emission_units:
-            curs.execute("""REPLACE INTO EmissionEmbodied(regions, emis_comm, tech, vintage, value, units, notes, 
-                        reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                        (province, row['Emission Commodity'], row['Technology'], row['Vintage'], row[parameter]*1000, row['Unit'].replace('kt', 't'), row['Notes'], 
-                        row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-        
-        else:
-            curs.execute("""REPLACE INTO EmissionEmbodied(regions, emis_comm, tech, vintage, value, units, notes, 
-                        reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                        (province, row['Emission Commodity'], row['Technology'], row['Vintage'], row[parameter], row['Unit'], row['Notes'], 
-                        row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    # Replace parameters in the database
+    bulk_insert(conn, 'EmissionEmbodied', df, {
+        'regions': province,
+        'emis_comm': 'Emission Commodity',
+        'tech': 'Technology',
+        'vintage': 'Vintage',
+        'value': df[parameter].where(~convert, df[parameter]*1000),
+        'units': df['Unit'].where(~convert, df['Unit'].astype(str).str.replace('kt', 't')),
+        'notes': 'Notes',
+        **dq_columns(df)
+    })
 
     print(f"Emission factors from capacity data compiled into {os.path.basename(database)}\n")
 
@@ -1195,7 +1387,7 @@ def compile_emissionemb():
 ##################################################
 """
 
-def compile_techinputsplit():
+def compile_techinputsplit(conn):
     """
     Reads tech input commodity splits from the .xlsx file and compiles them into .sqlite format 
     """
@@ -1203,15 +1395,12 @@ def compile_techinputsplit():
     parameter = 'TechInputSplit'
     last_col = 'Technological'
 
-    if sheet not in pd.ExcelFile(spreadsheet).sheet_names:
+    wb = workbook(spreadsheet)
+    if sheet not in wb.sheet_names:
         return None
     
-    # Reads excel sheet columns and limits the number of columns to the last DQI
-    cols = pd.read_excel(spreadsheet, sheet_name = sheet, header=None, skiprows=[0], nrows=1).iloc[0].values.tolist()
-    ncols = cols.index(last_col) #    Last column to read
-
     # Imports the table on the excel sheet
-    df = pd.read_excel(spreadsheet, sheet_name = sheet, skiprows=[0], usecols=range(ncols + 1))
+    df = wb.read(sheet, header=1, last_col=last_col)
     df.columns = df.columns.astype(str)
     df = df.loc[:, ~df.columns.str.contains('Unnamed')]
 
@@ -1226,20 +1415,18 @@ def compile_techinputsplit():
 
     # Round values to the nearest precision (decimal place) and normalize references to ASCII
     df[parameter] = df[parameter].round(precision)
-    df['Reference'] = df['Reference'].apply(normalize_to_ascii)
-
-    # Connect with database and replace parameters
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-
-    for _idx, row in df.iterrows():
-        curs.execute("""REPLACE INTO TechInputSplit(regions, periods, input_comm, tech, ti_split, ti_split_notes, reference, data_year, dq_rel, dq_comp, dq_time, dq_geog, dq_tech)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (province, row['Period'], row['Input Commodity'], row['Technology'], row[parameter], row['Notes'], 
-                row['Reference'], row['Data Year'], row['Reliability'], row['Representativeness'], dq_time(row['Data Year']), row['Geographical'], row['Technological']))
-            
-    conn.commit()
-    conn.close()
+    df['Reference'] = normalize_to_ascii(df['Reference'])
+
+    # Replace parameters in the database
+    bulk_insert(conn, 'TechInputSplit', df, {
+        'regions': province,
+        'periods': 'Period',
+        'input_comm': 'Input Commodity',
+        'tech': 'Technology',
+        'ti_split': parameter,
+        'ti_split_notes': 'Notes',
+        **dq_columns(df)
+    })
 
     print(f"Tech input commodity split data compiled into {os.path.basename(database)}\n")
 
@@ -1249,110 +1436,580 @@ def compile_techinputsplit():
 ##################################################
 """
 
-def update_cost_variable_entries():
-    # Connect to the SQLite database
-    conn = sqlite3.connect(database)
+def update_cost_variable_entries(conn):
+    """
+    Fills CostVariable for existing tech-vintage pairs without costs, from the next available vintage of the same tech
+    """
+    # Fetch data from ExistingCapacity and CostVariable tables once
+    existing_capacity_df = pd.read_sql_query("SELECT DISTINCT tech, vintage FROM ExistingCapacity", conn)
+    cost_variable_df = pd.read_sql_query("SELECT * FROM CostVariable", conn)
 
-    # Fetch data from ExistingCapacity and CostVariable tables
-    existing_capacity_df = pd.read_sql_query("SELECT tech, vintage FROM ExistingCapacity", conn)
-    cost_variable_df = pd.read_sql_query("SELECT tech, vintage FROM CostVariable", conn).drop_duplicates()
-
-    # Define thresholds for vintage
-    vintage_thresholds = [2005, 2010, 2015, 2020]
-
-    # Loop over each vintage threshold
-    for threshold in vintage_thresholds:
-        # Find all tech-vintage pairs missing in CostVariable for the current threshold
-        missing_pairs = existing_capacity_df.merge(cost_variable_df, on=['tech', 'vintage'], how='left', indicator=True)
-        missing_pairs = missing_pairs[(missing_pairs['_merge'] == 'left_only') & (missing_pairs['vintage'] <= threshold)].drop(columns=['_merge'])
-
-        # Loop through each missing pair to find and insert corresponding entries
-        for _, missing_row in missing_pairs.iterrows():
-            tech = missing_row['tech']
-            vintage = missing_row['vintage']
-
-            # Find the closest matching vintage in CostVariable that is greater than or equal to the current vintage
-            matched_rows = pd.read_sql_query(f"""
-                SELECT * FROM CostVariable
-                WHERE tech = '{tech}' AND vintage >= {vintage}
-                ORDER BY vintage ASC LIMIT 1
-            """, conn)
-            
-            if not matched_rows.empty:
-                matched_vintage = matched_rows['vintage'].iloc[0]
-                matched_cost_variable_entries = pd.read_sql_query(f"""
-                    SELECT * FROM CostVariable
-                    WHERE tech = '{tech}' AND vintage = {matched_vintage}
-                """, conn)
-
-                # Prepare new rows for the missing pair using the matched entries
-                new_rows = []
-                for _, entry_row in matched_cost_variable_entries.iterrows():
-                    # Check if the entry already exists
-                    existing_entry = pd.read_sql_query(f"""
-                        SELECT COUNT(*) as count FROM CostVariable
-                        WHERE tech = '{tech}' AND vintage = {vintage} AND periods = {entry_row['periods']}
-                    """, conn)
-                    
-                    if existing_entry['count'].iloc[0] == 0:
-                        new_row = entry_row.copy()
-                        new_row['vintage'] = vintage
-                        new_row['cost_variable_notes'] = 'Assumed the same value as the next quinquennium vintage (e.g., 2019 -> 2020)'
-                        new_rows.append(new_row)
-                
-                # Convert new rows to DataFrame and insert them
-                if new_rows:
-                    new_rows_df = pd.DataFrame(new_rows)
-                    new_rows_df.to_sql('CostVariable', conn, if_exists='append', index=False)
-
-    # Verify the insertion
-    new_entries_count = pd.read_sql_query("SELECT COUNT(*) FROM CostVariable WHERE cost_variable_notes='Inserted by script based on threshold match'", conn)
-    print(f"Inserted {new_entries_count['COUNT(*)'].iloc[0]} new entries into the CostVariable table.")
-
-    # Close the connection
-    conn.close()
+    # Only vintages up to the last existing capacity period are filled
+    vintage_threshold = 2020
+
+    # Find all tech-vintage pairs missing in CostVariable
+    missing_pairs = existing_capacity_df.merge(cost_variable_df[['tech', 'vintage']].drop_duplicates(), on=['tech', 'vintage'], how='left', indicator=True)
+    missing_pairs = missing_pairs[(missing_pairs['_merge'] == 'left_only') & (missing_pairs['vintage'] <= vintage_threshold)].drop(columns=['_merge'])
+
+    if missing_pairs.empty or cost_variable_df.empty:
+        print(f"Inserted 0 new entries into the CostVariable table.")
+        return
+
+    # Find the closest greater vintage in CostVariable for each missing pair of the same tech
+    available = cost_variable_df[['tech', 'vintage']].drop_duplicates().rename(columns={'vintage': 'matched_vintage'})
+    missing_pairs['vintage'] = missing_pairs['vintage'].astype('int64')
+    available['matched_vintage'] = available['matched_vintage'].astype('int64')
+    matches = pd.merge_asof(
+        missing_pairs.sort_values('vintage'), available.sort_values('matched_vintage'),
+        left_on='vintage', right_on='matched_vintage', by='tech', direction='forward'
+    ).dropna(subset=['matched_vintage'])
+
+    # Copy all entries of the matched vintage onto the missing vintage
+    new_rows = cost_variable_df.merge(
+        matches.rename(columns={'vintage': 'new_vintage', 'matched_vintage': 'vintage'}), on=['tech', 'vintage']
+    )
+    new_rows['vintage'] = new_rows.pop('new_vintage')
+    new_rows['cost_variable_notes'] = 'Assumed the same value as the next quinquennium vintage (e.g., 2019 -> 2020)'
+
+    bulk_insert(conn, 'CostVariable', new_rows, {col: col for col in cost_variable_df.columns})
+
+    print(f"Inserted {len(new_rows)} new entries into the CostVariable table.")
 
 
 """
 ##################################################
-    Compile all parameters
+    Input validation
 ##################################################
 """
 
-def compile_transport():
+# Parameter sheets validated before compiling, as (sheet, last_col, key columns, name of the year columns)
+parameter_sheets = [
+    ('Demand', 'Technological', ['Demand Commodity'], 'Period'),
+    ('Lifetime', 'Technological', ['Technology'], None),
+    ('ExCap', 'Technological', ['Technology'], 'Vintage'),
+    ('Cap2Act', 'Notes', ['Technology'], None),
+    ('CapFactor', 'Notes', ['Technology', 'Output Commodity'], 'Period'),
+    ('Efficiency', 'Technological', ['Input Commodity', 'Technology', 'Output Commodity'], 'Vintage'),
+    ('CostInvest', 'Technological', ['Technology'], 'Vintage'),
+    ('CostVariable', 'Technological', ['Technology', 'Period'], 'Vintage'),
+    ('CostFixed', 'Technological', ['Technology', 'Period'], 'Vintage'),
+    ('EmissionAct', 'Technological', ['Technology', 'Input Commodity', 'Output Commodity', 'Emission Commodity'], 'Vintage'),
+    ('EmissionEmb', 'Technological', ['Technology', 'Emission Commodity'], 'Vintage'),
+    ('InputSplit', 'Technological', ['Technology', 'Input Commodity', 'Output Commodity'], 'Period'),
+]
+
+# Sheets whose new processes must exist in Efficiency, or cleanup() removes them, with the year column matched against vintages
+process_sheets = {'CapFactor': 'Period', 'CostInvest': 'Vintage', 'CostVariable': 'Vintage', 'CostFixed': 'Vintage', 'EmissionAct': 'Vintage'}
+
+def sheet_entries(sheet, last_col, keys, year):
     """
-    Runs all compiling functions
+    Reads the keys of every entry of a parameter sheet, melting the year columns into one entry per non-empty value.
+    Entries keep their Excel row number for the report
     """
-    instantiate_database()
+    df = workbook(spreadsheet).read(sheet, header=1, last_col=last_col)
+    df.columns = df.columns.astype(str)
+    df['row'] = df.index + 3 #  Excel rows are counted from 1, after the title and header rows
+    df = df.dropna(subset=keys, how='all') #  Blank rows
 
-    insert_template()
-    compile_ref()
-    compile_techs()
-    compile_comms()
-    compile_demand()
+    if year is None: return df[keys + ['row']]
+    years = [col for col in df.columns if col.isdigit()]
+    df = pd.melt(df, id_vars=keys + ['row'], var_name=year, value_name='value', value_vars=years).dropna(subset=['value'])
+    df[year] = df[year].astype(int)
+    return df.drop(columns='value')
 
-    if charging_dsd: compile_dsd()
-    else: compile_cft()
+def validation_report(steps):
+    """
+    Checks the parameter sheets in memory against hash indexes of the Techs and Comms sheets, the (tech, vintage) processes
+    and (tech, period) pairs of the Efficiency sheet and the process lifetimes. Reports duplicate keys, unknown techs and commodities,
+    processes missing from Efficiency and entries outside process lifetimes in a single report
+    """
+    wb = workbook(spreadsheet)
+    inputs = {i for _, inputs, _, _ in steps for i in inputs}
+    sheets = [entry for entry in parameter_sheets if entry[0] in inputs and entry[0] in wb.sheet_names]
+    entries = {sheet: sheet_entries(sheet, last_col, keys, year) for sheet, last_col, keys, year in sheets}
+
+    techs = set(wb.read('Techs', last_col='Category')['Technology'].dropna()) if 'Techs' in wb.sheet_names else set()
+    comms = set(wb.read('Comms', last_col='Details')['Commodity'].dropna()) if 'Comms' in wb.sheet_names else set()
+
+    # Processes as compiled into Efficiency, with existing vintages aggregated into 5-year vintages
+    processes = pd.MultiIndex.from_arrays([[], []])
+    if 'Efficiency' in entries:
+        efficiency = entries['Efficiency'][['Technology', 'Vintage']].copy()
+        if aggregate_excap: efficiency['Vintage'] = efficiency['Vintage'].where(efficiency['Vintage'] > 2020, quinquennial_mapping(efficiency['Vintage']))
+        processes = pd.MultiIndex.from_frame(efficiency.drop_duplicates())
+
+    issues = []
+    def report(sheet, check, df, cols):
+        if len(df): issues.append(pd.DataFrame({'sheet': sheet, 'row': df['row'].values, 'check': check, 'key': df[cols].astype(str).agg(' / '.join, axis=1).values}))
+
+    for sheet, _, keys, year in sheets:
+        df = entries[sheet]
+        cols = keys + ([year] if year else [])
+
+        # Entries sharing a key are overwritten by the last one when loaded
+        report(sheet, 'duplicate key', df[df.duplicated(cols, keep=False)], cols)
+
+        if 'Technology' in df: report(sheet, 'unknown technology', df[~df['Technology'].isin(techs)], ['Technology'])
+        for col in [col for col in keys if col.endswith('Commodity')]:
+            report(sheet, 'unknown commodity', df[~df[col].isin(comms)], [col])
+
+        if sheet in process_sheets:
+            new = ~df['Technology'].astype(str).str.endswith('_EX')
+            missing = new & ~pd.MultiIndex.from_arrays([df['Technology'], df[process_sheets[sheet]]]).isin(processes)
+            report(sheet, 'no process in Efficiency', df[missing], ['Technology', process_sheets[sheet]])
+
+        # Entries dropped by the compile steps for falling outside the lifetime of their process
+        if sheet in ('CostVariable', 'CostFixed'):
+            report(sheet, 'outside lifetime', df[~within_lifetime(df)], ['Technology', 'Vintage', 'Period'])
+        if sheet == 'CapFactor':
+            period_0 = workbook(template).read('time_periods')
+            period_0 = period_0[period_0['flag'] == 'e'].max().values[0]
+            residual = df['Technology'].astype(str).str.endswith('_EX')
+            report(sheet, 'outside lifetime', df[residual & ~within_lifetime(df.assign(Vintage=period_0))], ['Technology', 'Period'])
+
+    report_df = pd.concat(issues, ignore_index=True) if issues else pd.DataFrame(columns=['sheet', 'row', 'check', 'key'])
+
+    if report_df.empty:
+        print(f"Input validation of {os.path.basename(spreadsheet)} found no issues\n")
+        return report_df
+
+    summary = report_df.groupby(['sheet', 'check'], sort=False).agg(
+        entries=('row', 'size'),
+        rows=('row', lambda rows: ', '.join(map(str, sorted(set(rows))[:5])) + (', ...' if rows.nunique() > 5 else '')),
+        example=('key', 'first'))
+    print(f"Input validation of {os.path.basename(spreadsheet)} found {len(report_df)} issues:")
+    print(summary.to_string(), "\n")
+
+    if validation_path: report_df.to_csv(validation_path, index=False)
+    if strict_validation: raise ValueError(f"Input validation found {len(report_df)} issues in {os.path.basename(spreadsheet)}")
+
+    return report_df
 
-    compile_lifetime()
-    compile_excap()
-    compile_c2a()
-    compile_acf()
-    compile_efficiency()
-    compile_costinvest()
-    compile_costvariable()
-    compile_costfixed()
-    compile_emissionact()
+"""
+##################################################
+    Compile steps and input hashes
+##################################################
+"""
 
-    if create_emission_embodied: compile_emissionemb()
+def compile_steps():
+    """
+    Compile steps in the order they run, as (function, inputs, reads, writes):
+    inputs are the spreadsheet sheets and files ('template', 'profile', 'settings') the step is compiled from,
+    reads are database tables the step depends on and writes are the tables it fills or modifies
+    """
+    steps = [
+        (insert_template, ['template'], [], template_tables),
+        (compile_ref, ['References'], [], ['references']),
+        (compile_techs, ['Techs'], [], ['technologies']),
+        (compile_comms, ['Comms'], [], ['commodities']),
+        (compile_demand, ['Demand'], [], ['Demand']),
+        (compile_dsd, ['DemandDist', 'profile'], [], ['DemandSpecificDistribution']) if charging_dsd else
+        (compile_cft, ['DemandDist', 'profile'], [], ['CapacityFactorTech']),
+        (compile_lifetime, ['Lifetime'], [], ['LifetimeTech']),
+        (compile_excap, ['ExCap'], [], ['ExistingCapacity']),
+        (compile_c2a, ['Cap2Act'], [], ['CapacityToActivity']),
+        (compile_acf, ['CapFactor', 'Lifetime', 'template'], [], ['MaxAnnualCapacityFactor', 'MinAnnualCapacityFactor']),
+        (compile_efficiency, ['Efficiency'], [], ['Efficiency']),
+        (compile_costinvest, ['CostInvest'], [], ['CostInvest']),
+        (compile_costvariable, ['CostVariable', 'Lifetime'], [], ['CostVariable']),
+        (compile_costfixed, ['CostFixed', 'Lifetime'], [], ['CostFixed']),
+        (compile_emissionact, ['EmissionAct'], [], ['EmissionActivity']),
+    ]
+    if create_emission_embodied: steps.append((compile_emissionemb, ['EmissionEmb'], [], ['EmissionEmbodied']))
+    steps.append((compile_techinputsplit, ['InputSplit'], [], ['TechInputSplit']))
+    if not aggregate_excap: steps.append((update_cost_variable_entries, [], ['ExistingCapacity', 'CostVariable'], ['CostVariable']))
+    steps.append((cleanup, [], ['ExistingCapacity', 'Efficiency'], [
+        'ExistingCapacity', 'Efficiency', 'CostVariable', 'CostFixed', 'CostInvest', 'EmissionActivity',
+        'MaxAnnualCapacityFactor', 'MinAnnualCapacityFactor', 'CapacityToActivity', 'LifetimeTech'
+    ]))
+
+    return steps
+
+def inputs_path():
+    """
+    Compiler metadata file next to the database, holding the input hashes of its last compile
+    """
+    return os.path.splitext(database)[0] + '.inputs.json'
 
-    compile_techinputsplit()
+def input_hashes(steps):
+    """
+    Content hashes of every input of the compile steps: each spreadsheet sheet, the template, the charging profile and the settings
+    """
+    def file_hash(path):
+        with open(path, 'rb') as f: return hashlib.sha256(f.read()).hexdigest()
+
+    settings = {
+        'province': province, 'weather_year': weather_year, 'time_zone': time_zone, 'charging_dsd': charging_dsd,
+        'aggregate_excap': aggregate_excap, 'create_emission_embodied': create_emission_embodied,
+        'convert_emission_units': convert_emission_units, 'epsilon': epsilon, 'precision': precision,
+        'year': datetime.today().year, # Time appropriateness DQIs depend on the current year
+        'schema': file_hash(schema),
+    }
 
-    if not aggregate_excap: update_cost_variable_entries()
+    wb = workbook(spreadsheet)
+    hashes = {}
+    for name in {i for _, inputs, _, _ in steps for i in inputs}:
+        if name == 'template': hashes[name] = file_hash(template)
+        elif name == 'profile': hashes[name] = file_hash(ldv_profile)
+        elif name in wb.sheet_names: hashes[name] = hashlib.sha256(wb.raw(name).to_csv().encode()).hexdigest()
+        else: hashes[name] = '' #   Missing sheets are skipped by their compile step
+    hashes['settings'] = hashlib.sha256(repr(sorted(settings.items())).encode()).hexdigest()
 
-    cleanup()
+    return hashes
+
+def steps_to_run(steps, changed):
+    """
+    Selects the compile steps whose inputs changed, along with the steps that depend on the tables they rebuild.
+    A step that modifies other steps' tables (e.g. cleanup) reruns when those tables are rebuilt, and if the tables
+    it reads are rebuilt, the tables it modified are rebuilt from the spreadsheet too
+    """
+    run = ['settings' in changed or bool(set(inputs) & changed) for _, inputs, _, _ in steps]
+
+    updated = True
+    while updated:
+        updated = False
+        for i, (_, _, reads, writes) in enumerate(steps):
+            if not reads: continue
+            rebuilt = {table for j in range(i) if run[j] for table in steps[j][3]}
+            if set(reads) & rebuilt:
+                for j in range(i):
+                    if not run[j] and not steps[j][2] and set(steps[j][3]) & set(writes): run[j] = updated = True
+            if not run[i] and set(reads + writes) & rebuilt: run[i] = updated = True
+
+    return [step for step, r in zip(steps, run) if r]
+
+"""
+##################################################
+    Parameter table cache
+##################################################
+"""
+
+def step_keys(steps, hashes):
+    """
+    Cache key of each compile step: hash of the step, its inputs and the keys of the steps that last wrote the tables it reads or modifies
+    """
+    keys, table_keys = {}, {}
+    for function, inputs, reads, writes in steps:
+        parts = [function.__name__, hashes['settings']] + [hashes[i] for i in inputs]
+        if reads: parts += [table_keys.get(table, '') for table in reads + writes]
+        keys[function] = hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+        for table in writes: table_keys[table] = keys[function]
+    return keys
+
+def cache_frame(df):
+    """
+    Prepares a table read back from sqlite for Parquet: numeric columns with nulls become floats (restored by the column affinity on load)
+    and columns mixing numbers and text (e.g. blank DQIs) are stored as text
+    """
+    for col in df.columns[df.dtypes == object]:
+        types = set(df[col].dropna().map(type))
+        if types and types <= {int, float}: df[col] = pd.to_numeric(df[col])
+        elif len(types) > 1: df[col] = df[col].map(lambda x: x if x is None else str(x))
+    return df
+
+def save_cache(conn, key, writes):
+    """
+    Writes the current content of the tables written by a step into the cache
+    """
+    path = cache_path + key + '/'
+    os.makedirs(path, exist_ok=True)
+
+    sql = {}
+    for table in writes:
+        cursor = conn.execute(f'SELECT * FROM "{table}"')
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+        cache_frame(df).to_parquet(path + table + '.parquet', index=False)
+        sql[table] = conn.execute("""SELECT sql FROM sqlite_master WHERE type='table' AND name = ?""", (table,)).fetchone()[0]
+
+    # Written last, so that an interrupted save is not taken as a cached step
+    with open(path + 'tables.json', 'w') as f: json.dump(sql, f, indent=1)
+
+def load_cache(conn, key, writes):
+    """
+    Replaces the content of the tables written by a step with their cached frames, recreating tables whose definition differs.
+    Returns the number of rows loaded
+    """
+    path = cache_path + key + '/'
+    with open(path + 'tables.json') as f: sql = json.load(f)
+
+    rows = 0
+
+    for table in writes:
+        current = conn.execute("""SELECT sql FROM sqlite_master WHERE type='table' AND name = ?""", (table,)).fetchone()
+        if current is None or current[0] != sql[table]:
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            conn.execute(sql[table])
+        conn.execute(f'DELETE FROM "{table}"')
+
+        df = pd.read_parquet(path + table + '.parquet')
+        cols = ', '.join(f'"{col}"' for col in df.columns)
+        values = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns]
+        conn.executemany(f'INSERT INTO "{table}" ({cols}) VALUES ({", ".join("?" * len(df.columns))})', zip(*values))
+        rows += len(df)
+
+    return rows
+
+def cached(key):
+    """
+    Whether a step was cached under the given key
+    """
+    return os.path.exists(cache_path + key + '/tables.json')
+
+def cached_tables(database=None):
+    """
+    Reads the cached frames of the tables of a compiled database, keyed by table name (by default the database currently set)
+    """
+    database = database or globals()['database'] #  Read at call time, as the database may be repointed after import
+    with open(cache_path + os.path.splitext(os.path.basename(database))[0] + '.json') as f: index = json.load(f)
+    return {table: pd.read_parquet(cache_path + key + '/' + table + '.parquet') for table, key in index.items()}
+
+"""
+##################################################
+    Temoa v3
+##################################################
+"""
+
+# Technology flags of the Temoa v3 schema: column -> (SQL LIKE patterns of the techs it applies to, value for those techs, value for the others)
+v3_technology_flags = {
+    'unlim_cap': (['T_IMP%', 'T_BLND%', 'T_EA%', 'T_OFF%', 'T_dummy%', 'H2_distribution'], 1, 0),
+    'annual': (['T_LDV_C_BEV%', 'T_LDV_LTP_BEV%', 'T_LDV_LTF_BEV%', 'T_LDV_M_BEV%', 'I_H2%'], 0, 1),
+    'cf_fixed': ([], 1, None),
+}
+
+# Techs matched by name exactly rather than by pattern
+v3_technology_names = {
+    'annual': ['T_LDV_BEV_CHRG', 'T_IMP_ELC', 'H2_COMP_10_100', 'H2_distribution', 'H2_storage', 'ELC_AC_DC'],
+    'cf_fixed': ['T_LDV_BEV_CHRG'], #  Only when charging is represented as a capacity factor (not in the DSD)
+}
+
+def like(values, pattern):
+    """
+    Vectorized SQL LIKE: % matches any text and _ any single character, ignoring the case of ASCII letters
+    """
+    regex = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern)
+    return values.str.fullmatch(regex, case=False, flags=re.ASCII).fillna(False).to_numpy(dtype=bool)
+
+def technology_flags(techs):
+    """
+    Temoa v3 technology flags of each tech, applying the rules of v3_technology_flags to the whole tech column at once
+    """
+    techs = pd.Series(techs, dtype=object)
+    flags = pd.DataFrame({'tech': techs})
+    for column, (patterns, matched, otherwise) in v3_technology_flags.items():
+        if column == 'cf_fixed' and charging_dsd: continue
+        match = techs.isin(v3_technology_names.get(column, [])).to_numpy()
+        for pattern in patterns: match |= like(techs, pattern)
+        flags[column] = np.where(match, matched, otherwise)
+    return flags
+
+def write_temoa_v3(conn):
+    """
+    Writes the compiled database in the Temoa v3 schema: migrates an in-memory copy of it with the v2 to v3 script,
+    sets the technology flags and saves it to v3_database
+    """
+    v3 = sqlite3.connect(':memory:')
+    conn.backup(v3)
+    with open(v3_migration, 'r') as f: v3.executescript(f.read())
+
+    flags = technology_flags([t for (t,) in v3.execute("""SELECT tech FROM Technology""")])
+    columns = [col for col in flags.columns if col != 'tech']
+    v3.executemany(f"""UPDATE Technology SET {', '.join(f'{col} = ?' for col in columns)} WHERE tech = ?""",
+                   flags[columns + ['tech']].astype(object).itertuples(index=False, name=None))
+    v3.commit()
+
+    os.makedirs(os.path.dirname(v3_database), exist_ok=True)
+    save_database(v3, v3_database)
+    v3.close()
+
+    print(f"Temoa v3 database written to {os.path.basename(v3_database)}\n")
+
+def record(function):
+    """
+    Runs a compile step against a Recorder and returns it
+    """
+    recorder = Recorder()
+    function(recorder)
+    return recorder
+
+"""
+##################################################
+    Instrumentation
+##################################################
+"""
+
+step_stats = [] #   One entry per phase (parse, transform, write, ...) of each step of the last compile
+phases = ['parse', 'hash', 'validate', 'transform', 'run', 'write', 'cache load', 'cache save', 'save', 'temoa v3'] #  Order of the phases in the step report
+
+def instrumented(step, phase, function, *args):
+    """
+    Runs one phase of a compile step and records its wall time, and its peak memory if traced.
+    Runs it under cProfile and prints the hottest calls if the step is listed in profile_steps
+    """
+    profile = cProfile.Profile() if profiled(step) else None
+    if trace_memory: tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    result = profile.runcall(function, *args) if profile else function(*args)
+
+    entry = {'step': step, 'phase': phase, 'thread': threading.current_thread().name, 'start': start, 'seconds': time.perf_counter() - start}
+    if trace_memory: entry['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    step_stats.append(entry)
+
+    if profile:
+        print(f"cProfile of {step} ({phase}):")
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(25)
+
+    return result, entry
+
+def profiled(step):
+    """
+    Whether a step runs under cProfile
+    """
+    return step in profile_steps or 'all' in profile_steps
+
+def rows_read(conn, inputs, reads):
+    """
+    Number of rows a step reads, from its input sheets and from the database tables it depends on
+    """
+    wb = workbook(spreadsheet)
+    sheets = sum(len(wb.raw(sheet)) for sheet in inputs if sheet in wb.sheet_names)
+    tables = sum(conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in reads)
+    return sheets + tables
+
+def report_steps(stats):
+    """
+    Prints the instrumentation of a compile as a table of steps, and writes it as JSON or a Chrome trace if report_path is set
+    """
+    df = pd.DataFrame(stats)
+    df['phase'] = pd.Categorical(df['phase'], list(dict.fromkeys(phases + df['phase'].tolist()))) #  Phases not listed come last rather than being dropped
+    table = df.pivot_table(index='step', columns='phase', values='seconds', aggfunc='sum', observed=True, sort=False).round(3)
+    table = table.loc[df.loc[df['phase'] != 'transform', 'step'].unique()] #  Steps in the order the writer applied them
+    table['total'] = table.sum(axis=1)
+    for col in ['rows_read', 'rows_written']:
+        if col in df: table[col] = df.groupby('step', sort=False)[col].max().astype('Int64')
+    if 'peak_mb' in df: table['peak_mb'] = df.groupby('step', sort=False)['peak_mb'].max().round(1)
+    table = table.astype(object).where(table.notna(), '')
+
+    print("Compile steps (s):")
+    print(table.to_string())
+    print(f"\nTotal wall time: {max(e['start'] + e['seconds'] for e in stats) - min(e['start'] for e in stats):.2f} s\n")
+
+    if not report_path: return
+
+    origin = min(e['start'] for e in stats)
+    if report_path.endswith('.trace.json'):
+        # Chrome trace event format (chrome://tracing or https://ui.perfetto.dev), one row per thread
+        threads = {name: i for i, name in enumerate(dict.fromkeys(e['thread'] for e in stats))}
+        events = [{
+            'name': e['step'], 'cat': e['phase'], 'ph': 'X', 'pid': os.getpid(), 'tid': threads[e['thread']],
+            'ts': (e['start'] - origin) * 1e6, 'dur': e['seconds'] * 1e6,
+            'args': {k: v for k, v in e.items() if k in ['rows_read', 'rows_written', 'peak_mb']}
+        } for e in stats]
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': i, 'args': {'name': name}} for name, i in threads.items()]
+        report = {'traceEvents': events}
+    else:
+        report = {'database': database, 'spreadsheet': spreadsheet, 'steps': [dict(e, start=e['start'] - origin) for e in stats]}
+
+    with open(report_path, 'w') as f: json.dump(report, f, indent=1)
+    print(f"Step report written to {report_path}\n")
+
+"""
+##################################################
+    Compile all parameters
+##################################################
+"""
+
+def compile_transport():
+    """
+    Runs the compiling functions over a single connection and commits them as one transaction.
+    Unless the database is wiped, only the tables whose inputs changed since the last compile are rebuilt
+    """
+    step_stats.clear()
+    if trace_memory: tracemalloc.start()
+
+    new_db = not os.path.exists(database)
+    conn = instantiate_database()
+
+    try:
+        # Parses all input sheets up front, in parallel, then compares their hashes with those stored next to the database by the last compile
+        steps = compile_steps()
+        instrumented('input sheets', 'parse', workbook(spreadsheet).preload, [i for _, inputs, _, _ in steps for i in inputs], compile_workers)
+        hashes, _ = instrumented('input sheets', 'hash', input_hashes, steps)
+        if validate_inputs: instrumented('input sheets', 'validate', validation_report, steps)
+        conn.execute("""DROP TABLE IF EXISTS compile_inputs""") #   Where earlier compiles stored the hashes, inside the database
+        stored = {}
+        if not (new_db or wipe_database) and os.path.exists(inputs_path()):
+            with open(inputs_path(), 'r') as f: stored = json.load(f)
+        changed = {i for i, h in hashes.items() if stored.get(i) != h}
+
+        run = steps_to_run(steps, changed)
+        if stored and run: print(f"Inputs changed: {', '.join(sorted(changed))}; rebuilding {', '.join(sorted({t for _, _, reads, writes in run if not reads for t in writes}))}\n")
+        elif stored: print(f"No inputs changed since the last compile of {os.path.basename(database)}\n")
+
+        # Steps compiled only from their inputs are parsed and transformed concurrently in worker threads, recording their writes.
+        # The writer applies them in the declared order, which follows their dependencies, and runs the steps reading the database in turn
+        # Steps found in the table cache are bulk loaded from it instead
+        keys = step_keys(steps, hashes)
+        loaded = {function for function, _, _, _ in run if cache_tables and cached(keys[function])}
+
+        # Steps traced for memory or profiled run in the writer, so that their measurements are not mixed with other threads
+        threaded = {function for function, _, reads, _ in run if not reads and function not in loaded and not profiled(function.__name__)}
+        if compile_workers < 2 or trace_memory: threaded = set()
+
+        tables = {t for (t,) in conn.execute("""SELECT name FROM sqlite_master WHERE type='table'""")}
+        schema_tables() #   Introspected here, so that the worker threads only read the table schemas
+        with ThreadPoolExecutor(max_workers=max(compile_workers, 1)) as pool:
+            recorders = {function: pool.submit(instrumented, function.__name__, 'transform', record, function) for function in threaded}
+
+            for function, inputs, reads, writes in run:
+                name = function.__name__
+
+                if function in loaded:
+                    rows, entry = instrumented(name, 'cache load', load_cache, conn, keys[function], writes)
+                    entry.update(rows_read=rows, rows_written=rows)
+                    print(f"{name} loaded from the table cache\n")
+                    continue
+
+                # Tables rebuilt from the spreadsheet are emptied first, so that removed rows do not linger
+                if not reads:
+                    for table in set(writes) & tables: conn.execute(f'DELETE FROM "{table}"')
+
+                read = rows_read(conn, inputs, reads)
+                changes = conn.total_changes
+                if function in recorders: _, entry = instrumented(name, 'write', recorders[function].result()[0].apply, conn)
+                else: _, entry = instrumented(name, 'run', function, conn)
+                entry.update(rows_read=read, rows_written=conn.total_changes - changes) #  Rows inserted, replaced or deleted
+
+                if cache_tables: instrumented(name, 'cache save', save_cache, conn, keys[function], writes)
+
+        # Indexes the cached frames holding the final content of each table of this database
+        if cache_tables:
+            with open(cache_path + os.path.splitext(os.path.basename(database))[0] + '.json', 'w') as f:
+                json.dump({table: keys[function] for function, _, _, writes in steps for table in writes}, f, indent=1)
+
+        conn.commit()
+        if build_in_memory: instrumented('database', 'save', save_database, conn)
+
+        # Written once the database is saved, so the hashes never describe tables that were not compiled
+        with open(inputs_path(), 'w') as f: json.dump(hashes, f, indent=1)
+        if temoa_v3: instrumented('database', 'temoa v3', write_temoa_v3, conn)
+
+    except BaseException:
+        # Roll back so a failed compile never leaves a half-built database behind
+        conn.rollback()
+        conn.close()
+        if new_db and os.path.exists(database): os.remove(database)
+        print(f"Compile of {os.path.basename(database)} failed; all changes were rolled back\n")
+        raise
+
+    finally:
+        if trace_memory: tracemalloc.stop()
+
+    conn.close()
 
     print(f"All parameter data from {os.path.basename(spreadsheet)} compiled into {os.path.basename(database)}\n")
 
+    report_steps(step_stats)
+
 if __name__ == "__main__":
     compile_transport()
\ No newline at end of file